@@ -0,0 +1,41 @@
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+import pytest_asyncio
+
+# main imports through the apps package, so the repository root must be importable
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Import main exactly once for the whole session, with the external clients mocked.
+# The patch only covers the import, so the real modules are never required by the tests.
+with patch.dict(
+    "sys.modules",
+    {
+        "nats.aio.client": MagicMock(),
+        "temporalio.client": MagicMock(),
+        "temporalio.worker": MagicMock(),
+    },
+):
+    from apps.guard_api import main as guard_api_main
+
+# guard-codex also ships a main.py on sys.path; tests (and patch targets) mean this one
+sys.modules["main"] = guard_api_main
+
+
+@pytest.fixture(scope="session")
+def guard_main():
+    """The guard-api main module, imported once per session"""
+    return guard_api_main
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def aclient(guard_main):
+    """In-process ASGI client for async tests; avoids TestClient's per-request thread portal"""
+    transport = httpx.ASGITransport(app=guard_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
@@ -1,14 +1,17 @@
+import asyncio
+import binascii
 import hashlib
 import hmac
 import json
 import os
 import time
+from functools import lru_cache
 
 import httpx
-from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi import FastAPI, HTTPException, Request, Response
 from nats.aio.client import Client as NATS
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from temporalio.client import Client as Temporal
 
 from apps.shared.config import settings
@@ -25,8 +28,30 @@ from .metrics import (
     start_metrics_server,
 )
 
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
 # Constants
 LOW_RISK_THRESHOLD = 0.30
+CODEX_TIMEOUT_SECONDS = 15
+CODEX_MAX_KEEPALIVE_CONNECTIONS = 32
+CODEX_MAX_CONNECTIONS = 64
+NATS_PUBLISH_BATCH_SIZE = 64
+NATS_DRAIN_TIMEOUT_SECONDS = 5
+NATS_SUBJECT_CACHE_SIZE = 256
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Shared digest field values; tuples so no request can mutate them (serialized as JSON arrays)
+LABELS_LOW_RISK = ("risk:low",)
+LABELS_MEDIUM_RISK = ("risk:med",)
+POLICIES_CREATE_TAG = ("release-window",)
+POLICIES_NONE = ()
+ENVELOPE_OBJECT_FIELDS = ("pull_request", "analysis", "changes", "repository", "release", "sender")
 
 app = FastAPI(title="GitGuard API", version="1.0.0")
 
@@ -41,13 +66,33 @@ app.add_middleware(MetricsMiddleware)
 
 CODEX_URL = os.getenv("CODEX_URL", "http://codex:8010")
 WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")  # empty -> skip verify (demo)
+SIGNATURE_PREFIX = b"sha256="
+SIGNATURE_LENGTH = len(SIGNATURE_PREFIX) + 2 * hashlib.sha256().digest_size  # 71 bytes
 NATS_URL = os.getenv("NATS_URL", "nats://nats:4222")
 TEMPORAL_ADDRESS = os.getenv("TEMPORAL_ADDRESS", "temporal:7233")
 
 # Clients will be stored in app.state instead of global variables
 
 
+def _reset_client_state() -> None:
+    """Set every app.state handle to its sentinel so it can be read without hasattr()."""
+    app.state.nats_client = None
+    app.state.temporal_client = None
+    app.state.http_client = None
+    app.state.codex_tasks = set()
+    app.state.publish_queue = None
+    app.state.publish_task = None
+
+
+_reset_client_state()
+
+
 class PRAudit(BaseModel):
+    """Schema of the digest payload sent to Codex (built as a plain dict on the hot path)."""
+
+    # Digests are immutable records; unknown keys from older senders are dropped
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     number: int
     title: str | None = None
     labels: list[str] = []
@@ -61,63 +106,217 @@ class PRAudit(BaseModel):
     summary: str = ""
 
 
-def _verify_signature(secret: str, signature: str | None, body_bytes: bytes) -> bool:
+def _json_loads(data: bytes):
+    """Decode a JSON document straight from the raw request bytes."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    # json.loads also takes bytes, avoiding a decoded copy of the payload
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> bytes:
+    """Encode an object to JSON bytes ready for NATS publishing."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def _valid_envelope(body) -> bool:
+    """Structural check of the webhook envelope; leaf values are coerced inline."""
+    if not isinstance(body, dict):
+        return False
+    return all(isinstance(body.get(field) or {}, dict) for field in ENVELOPE_OBJECT_FIELDS)
+
+
+def _as_float(value) -> float:
+    """Numeric webhook field as float; missing or non-numeric values count as 0.0."""
+    try:
+        return float(value or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _as_int(value) -> int:
+    """Integer webhook field; missing or non-numeric values count as 0."""
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _verify_signature(secret: str, signature: str | bytes | None, body_bytes: bytes) -> bool:
     if not secret:
         return True  # demo mode
-    if not signature or not signature.startswith("sha256="):
+    if not signature:
         return False
-    mac = hmac.new(secret.encode(), msg=body_bytes, digestmod=hashlib.sha256).hexdigest()
-    return hmac.compare_digest(f"sha256={mac}", signature)
+    sig = signature.encode() if isinstance(signature, str) else signature
+    # Malformed headers are rejected on length/prefix before any hashing
+    if len(sig) != SIGNATURE_LENGTH or not sig.startswith(SIGNATURE_PREFIX):
+        return False
+    try:
+        expected = binascii.unhexlify(sig[len(SIGNATURE_PREFIX) :])
+    except ValueError:
+        return False
+    # One-shot HMAC: no hmac.HMAC object and no hex encoding of our side
+    return hmac.compare_digest(hmac.digest(secret.encode(), body_bytes, "sha256"), expected)
+
+
+@lru_cache(maxsize=NATS_SUBJECT_CACHE_SIZE)
+def _nats_subject(event_type: str, action: str) -> str:
+    """NATS subject for a GitHub event/action pair, formatted once per pair."""
+    return f"gh.{event_type}.{action}"
+
+
+def _new_http_client() -> httpx.AsyncClient:
+    """Create the pooled HTTP client used for Codex calls."""
+    return httpx.AsyncClient(
+        timeout=CODEX_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_keepalive_connections=CODEX_MAX_KEEPALIVE_CONNECTIONS,
+            max_connections=CODEX_MAX_CONNECTIONS,
+        ),
+    )
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it if startup has not run."""
+    client = app.state.http_client
+    if client is None:
+        client = app.state.http_client = _new_http_client()
+    return client
+
+
+async def _post_codex_background(client: httpx.AsyncClient, payload: dict) -> None:
+    """Send the legacy Codex digest off the request path, recording metrics."""
+    codex_start = time.perf_counter()
+    try:
+        response = await client.post(
+            f"{CODEX_URL}/codex/pr-digest", content=_json_dumps(payload), headers=JSON_HEADERS
+        )
+        record_codex_request(
+            "/codex/pr-digest", response.status_code, time.perf_counter() - codex_start
+        )
+    except Exception as e:
+        # Non-fatal in demo: NATS remains the primary delivery path
+        record_codex_request("/codex/pr-digest", 0, time.perf_counter() - codex_start)
+        logger.warning("codex_http_failed", error=str(e))
+
+
+def _schedule_codex_post(payload: dict) -> None:
+    """Fire-and-forget the Codex digest, keeping a reference until it finishes."""
+    tasks = app.state.codex_tasks
+    task = asyncio.create_task(_post_codex_background(_get_http_client(), payload))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+
+async def _drain_publish_queue(nats_client: NATS, queue: asyncio.Queue) -> None:
+    """Publish queued webhook events in batches with a single flush per batch."""
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < NATS_PUBLISH_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+
+        published = []
+        for subject, data in batch:
+            try:
+                await nats_client.publish(subject, data)
+                published.append(subject)
+            except Exception as e:
+                record_nats_message(subject, False)
+                logger.warning("nats_publish_failed", subject=subject, error=str(e))
+
+        try:
+            if published:
+                await nats_client.flush()
+            for subject in published:
+                record_nats_message(subject, True)
+                logger.debug("nats_published", subject=subject)
+        except Exception as e:
+            for subject in published:
+                record_nats_message(subject, False)
+            logger.warning("nats_flush_failed", batch_size=len(published), error=str(e))
+        finally:
+            for _ in batch:
+                queue.task_done()
 
 
 @app.on_event("startup")
 async def startup_event():
     # Initialize clients in app.state instead of global variables
-    app.state.nats_client = None
-    app.state.temporal_client = None
+    _reset_client_state()
+    app.state.http_client = _new_http_client()
 
     # Start Prometheus metrics server
     metrics_port = int(os.getenv("METRICS_PORT", "8080"))
     start_metrics_server(metrics_port)
-    print(f"[guard-api] Metrics server started on port {metrics_port}")
+    logger.info("metrics_server_started", port=metrics_port)
 
     try:
         # Initialize NATS client
         app.state.nats_client = NATS()
         await app.state.nats_client.connect(servers=[NATS_URL])
-        print(f"[guard-api] Connected to NATS at {NATS_URL}")
+        logger.info("nats_connected", url=NATS_URL)
         record_connection_status("nats", True)
+        app.state.publish_queue = asyncio.Queue()
+        app.state.publish_task = asyncio.create_task(
+            _drain_publish_queue(app.state.nats_client, app.state.publish_queue)
+        )
 
         # Initialize Temporal client
         app.state.temporal_client = await Temporal.connect(TEMPORAL_ADDRESS)
-        print(f"[guard-api] Connected to Temporal at {TEMPORAL_ADDRESS}")
+        logger.info("temporal_connected", address=TEMPORAL_ADDRESS)
         record_connection_status("temporal", True)
     except Exception as e:
-        print(f"[guard-api] Warning: Failed to initialize clients: {e}")
+        logger.warning("client_init_failed", error=str(e))
         record_connection_status("nats", False)
         record_connection_status("temporal", False)
         # Continue without clients for demo purposes
 
 
+async def _drain_nats_on_shutdown() -> None:
+    """Give queued NATS events a bounded window to publish, then stop the drain task."""
+    publish_task = app.state.publish_task
+    if publish_task is None:
+        return
+    try:
+        await asyncio.wait_for(app.state.publish_queue.join(), NATS_DRAIN_TIMEOUT_SECONDS)
+    except TimeoutError:
+        logger.warning("nats_events_dropped", pending=app.state.publish_queue.qsize())
+    publish_task.cancel()
+    app.state.publish_task = None
+
+
+async def _wait_codex_tasks() -> None:
+    """Let in-flight Codex digest posts finish."""
+    codex_tasks = app.state.codex_tasks
+    if codex_tasks:
+        await asyncio.gather(*codex_tasks, return_exceptions=True)
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    if hasattr(app.state, "nats_client") and app.state.nats_client:
+    # The NATS drain and the Codex posts are independent; wait for both at once
+    await asyncio.gather(_drain_nats_on_shutdown(), _wait_codex_tasks())
+    if app.state.http_client is not None:
+        await app.state.http_client.aclose()
+        app.state.http_client = None
+    if app.state.nats_client is not None:
         await app.state.nats_client.close()
         record_connection_status("nats", False)
-    if hasattr(app.state, "temporal_client") and app.state.temporal_client:
+    if app.state.temporal_client is not None:
         record_connection_status("temporal", False)
         await app.state.temporal_client.close()
 
 
 @app.post("/webhook/github")
-async def github_webhook(
-    req: Request,
-    x_github_event: str = Header(default=""),
-    x_github_delivery: str = Header(default=""),
-    x_hub_signature_256: str = Header(default=None),
-):
-    start_time = time.time()
-    event_type = x_github_event or "unknown"
+async def github_webhook(req: Request):
+    start_time = time.perf_counter()
+    # Raw ASGI headers (lower-cased bytes); only the values we emit get decoded
+    headers = dict(req.scope["headers"])
+    event_type = headers.get(b"x-github-event", b"").decode("latin-1") or "unknown"
+    x_github_delivery = headers.get(b"x-github-delivery", b"").decode("latin-1")
+    x_hub_signature_256 = headers.get(b"x-hub-signature-256")
     action = "unknown"
 
     body_bytes = await req.body()
@@ -127,84 +326,78 @@ async def github_webhook(
     record_webhook_signature_validation(signature_valid)
 
     if not signature_valid:
-        record_webhook_event(event_type, action, False, time.time() - start_time)
+        record_webhook_event(event_type, action, False, time.perf_counter() - start_time)
         raise HTTPException(status_code=401, detail="invalid signature")
 
     try:
-        body = json.loads(body_bytes.decode("utf-8"))
-        action = body.get("action", "unknown")
+        body = _json_loads(body_bytes)
     except Exception as e:
-        record_webhook_event(event_type, action, False, time.time() - start_time)
+        record_webhook_event(event_type, action, False, time.perf_counter() - start_time)
         raise HTTPException(status_code=400, detail="invalid json") from e
 
+    if not _valid_envelope(body):
+        record_webhook_event(event_type, action, False, time.perf_counter() - start_time)
+        raise HTTPException(status_code=400, detail="invalid payload")
+    action = body.get("action", "unknown")
+
+    # Bind the envelope fields once; reused by the digest and the NATS event
     pr = body.get("pull_request") or {}
     analysis = body.get("analysis") or {}
     changes = body.get("changes") or {}
-
-    payload = PRAudit(
-        number=int(pr.get("number") or 0),
-        title=pr.get("title") or "",
-        labels=(
-            ["risk:low"]
-            if float(analysis.get("risk_score") or 0.0) <= LOW_RISK_THRESHOLD
-            else ["risk:med"]
-        ),
-        risk_score=round(float(analysis.get("risk_score") or 0.0), 3),
-        checks_passed=bool(analysis.get("checks_passed", True)),  # demo default
-        changed_paths=list(changes.get("files") or []),
-        coverage_delta=float(analysis.get("coverage_delta") or 0.0),
-        perf_delta=float(analysis.get("performance_delta") or 0.0),
-        policies=["release-window"] if body.get("action") == "create_tag" else [],
-        release_window_state="blocked" if body.get("action") == "create_tag" else "open",
-        summary=f"Autogenerated digest for PR #{pr.get('number')}",
-    ).model_dump()
-
-    # Legacy HTTP call to Codex (for backward compatibility)
-    async with httpx.AsyncClient(timeout=15) as client:
-        try:
-            codex_start = time.time()
-            response = await client.post(f"{CODEX_URL}/codex/pr-digest", json=payload)
-            record_codex_request(
-                "/codex/pr-digest", response.status_code, time.time() - codex_start
-            )
-        except Exception as e:
-            # Non-fatal in demo: continue with NATS publishing
-            record_codex_request("/codex/pr-digest", 0, time.time() - codex_start)
-            print(f"[guard-api] Codex HTTP call failed: {e}")
+    repository = body.get("repository", {})
+    release = body.get("release", {})
+    sender = body.get("sender", {})
+    pr_number = pr.get("number")
+
+    # Plain dict with the PRAudit shape; skips a Pydantic validate/dump pass per webhook
+    risk_score = _as_float(analysis.get("risk_score"))
+    is_create_tag = action == "create_tag"
+    payload = {
+        "number": _as_int(pr_number),
+        "title": pr.get("title") or "",
+        "labels": LABELS_LOW_RISK if risk_score <= LOW_RISK_THRESHOLD else LABELS_MEDIUM_RISK,
+        "risk_score": round(risk_score, 3),
+        "checks_passed": bool(analysis.get("checks_passed", True)),  # demo default
+        "changed_paths": list(changes.get("files") or []),
+        "coverage_delta": _as_float(analysis.get("coverage_delta")),
+        "perf_delta": _as_float(analysis.get("performance_delta")),
+        "policies": POLICIES_CREATE_TAG if is_create_tag else POLICIES_NONE,
+        "release_window_state": "blocked" if is_create_tag else "open",
+        "summary": f"Autogenerated digest for PR #{pr_number}",
+    }
+
+    # Legacy HTTP call to Codex (for backward compatibility), kept off the critical path
+    _schedule_codex_post(payload)
 
     # Publish event to NATS for Temporal workflow processing
-    subject = f"gh.{event_type}.{action}"
-
-    if hasattr(app.state, "nats_client") and app.state.nats_client:
-        try:
-            # Create enriched event payload for Codex workflow
-            event_payload = {
-                "event": event_type,
-                "action": body.get("action", "unknown"),
-                "delivery_id": x_github_delivery,
-                "repository": body.get("repository", {}),
-                "pull_request": body.get("pull_request", {}),
-                "release": body.get("release", {}),
-                "sender": body.get("sender", {}),
-                # Add processed analysis data
-                "risk": {"score": payload["risk_score"]},
-                "checks": {"all_passed": payload["checks_passed"]},
-                "changed_files": payload["changed_paths"],
-                "coverage_delta": payload["coverage_delta"],
-                "perf_delta": payload["perf_delta"],
-                "release_window_state": payload["release_window_state"],
-                "summary": payload["summary"],
-            }
-
-            await app.state.nats_client.publish(subject, json.dumps(event_payload).encode())
-            record_nats_message(subject, True)
-            print(f"[guard-api] Published to NATS: {subject}")
-        except Exception as e:
-            record_nats_message(subject, False)
-            print(f"[guard-api] NATS publish failed: {e}")
+    subject = _nats_subject(event_type, str(action))
+
+    publish_queue = app.state.publish_queue
+    if publish_queue is not None:
+        # Create enriched event payload for Codex workflow
+        event_payload = {
+            "event": event_type,
+            "action": action,
+            "delivery_id": x_github_delivery,
+            "repository": repository,
+            "pull_request": pr,
+            "release": release,
+            "sender": sender,
+            # Add processed analysis data
+            "risk": {"score": payload["risk_score"]},
+            "checks": {"all_passed": payload["checks_passed"]},
+            "changed_files": payload["changed_paths"],
+            "coverage_delta": payload["coverage_delta"],
+            "perf_delta": payload["perf_delta"],
+            "release_window_state": payload["release_window_state"],
+            "summary": payload["summary"],
+        }
+
+        # Serialized once here; the drain task publishes these bytes as-is
+        publish_queue.put_nowait((subject, _json_dumps(event_payload)))
 
     # Record successful webhook processing
-    record_webhook_event(event_type, action, True, time.time() - start_time)
+    record_webhook_event(event_type, action, True, time.perf_counter() - start_time)
 
     return {"status": "processed", "delivery_id": x_github_delivery}
 
@@ -223,4 +416,4 @@ async def metrics():
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
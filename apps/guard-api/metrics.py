@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import logging
 import time
+from functools import lru_cache
 
 from prometheus_client import Counter, Gauge, Histogram, start_http_server
 
@@ -11,6 +12,12 @@ MEDIUM_RISK_THRESHOLD = 0.7
 
 # API path parsing constants
 MIN_API_PATH_PARTS = 4
+API_V1_PREFIX = "/api/v1/"
+ENDPOINT_CACHE_SIZE = 1024
+LABEL_CHILD_CACHE_SIZE = 256
+
+# Static route prefixes collapsed to a single endpoint label
+_STATIC_PREFIXES = {"/webhook": "/webhook", "/health": "/health", "/metrics": "/metrics"}
 
 # API-specific metrics
 api_requests_total = Counter(
@@ -95,10 +102,22 @@ def start_metrics_server(port: int = 8080) -> None:
         logger.error(f"Failed to start metrics server: {e}")
 
 
+@lru_cache(maxsize=LABEL_CHILD_CACHE_SIZE)
+def _api_requests_child(method: str, endpoint: str, status_code: int):
+    """Bound api_requests_total child; endpoints are already normalized."""
+    return api_requests_total.labels(method=method, endpoint=endpoint, status_code=status_code)
+
+
+@lru_cache(maxsize=LABEL_CHILD_CACHE_SIZE)
+def _api_duration_child(method: str, endpoint: str):
+    """Bound api_request_duration_seconds child."""
+    return api_request_duration_seconds.labels(method=method, endpoint=endpoint)
+
+
 def record_api_request(method: str, endpoint: str, status_code: int, duration: float) -> None:
     """Record API request metrics."""
-    api_requests_total.labels(method=method, endpoint=endpoint, status_code=status_code).inc()
-    api_request_duration_seconds.labels(method=method, endpoint=endpoint).observe(duration)
+    _api_requests_child(method, endpoint, status_code).inc()
+    _api_duration_child(method, endpoint).observe(duration)
 
 
 def record_webhook_event(
@@ -173,7 +192,7 @@ class MetricsMiddleware:
             await self.app(scope, receive, send)
             return
 
-        start_time = time.time()
+        start_time = time.perf_counter()
         method = scope["method"]
         path = scope["path"]
 
@@ -183,7 +202,7 @@ class MetricsMiddleware:
         async def send_wrapper(message):
             if message["type"] == "http.response.start":
                 status_code = message["status"]
-                duration = time.time() - start_time
+                duration = time.perf_counter() - start_time
                 record_api_request(method, endpoint, status_code, duration)
             await send(message)
 
@@ -191,17 +210,20 @@ class MetricsMiddleware:
 
     def _normalize_endpoint(self, path: str) -> str:
         """Normalize endpoint paths to reduce cardinality."""
-        # Replace dynamic segments with placeholders
-        if path.startswith("/webhook"):
-            return "/webhook"
-        elif path.startswith("/health"):
-            return "/health"
-        elif path.startswith("/metrics"):
-            return "/metrics"
-        elif path.startswith("/api/v1/"):
-            # Extract the main API endpoint
-            parts = path.split("/")
-            if len(parts) >= MIN_API_PATH_PARTS:
-                return f"/api/v1/{parts[3]}"
-
-        return path
+        return normalize_endpoint(path)
+
+
+@lru_cache(maxsize=ENDPOINT_CACHE_SIZE)
+def normalize_endpoint(path: str) -> str:
+    """Map a request path onto a low-cardinality endpoint label."""
+    # Replace dynamic segments with placeholders
+    for prefix, endpoint in _STATIC_PREFIXES.items():
+        if path.startswith(prefix):
+            return endpoint
+    if path.startswith(API_V1_PREFIX):
+        # Extract the main API endpoint
+        parts = path.split("/")
+        if len(parts) >= MIN_API_PATH_PARTS:
+            return f"/api/v1/{parts[3]}"
+
+    return path
@@ -1,11 +1,26 @@
+import asyncio
 import hashlib
 import hmac
 import json
-from unittest.mock import AsyncMock, MagicMock, patch
+from functools import lru_cache
+from types import SimpleNamespace
 
 import httpx
+import main
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
+from main import (
+    PRAudit,
+    _drain_publish_queue,
+    _nats_subject,
+    _verify_signature,
+    _wait_codex_tasks,
+    app,
+    shutdown_event,
+    startup_event,
+)
+from pydantic import ValidationError
 
 # Test constants
 TEST_PR_NUMBER_1 = 123
@@ -32,7 +47,6 @@ TEST_LOW_RISK_THRESHOLD = 0.15
 HTTP_OK = 200
 HTTP_BAD_REQUEST = 400
 HTTP_UNAUTHORIZED = 401
-HTTP_SERVICE_UNAVAILABLE = 503
 DEFAULT_RISK_SCORE = 0.0
 DEFAULT_COVERAGE_DELTA = 0.0
 DEFAULT_PERF_DELTA = 0.0
@@ -41,64 +55,216 @@ DEFAULT_TITLE = ""
 RISK_THRESHOLD_LOW = 0.30
 TEST_TIMEOUT_SECONDS = 15
 TEST_RESPONSE_TIME = 1.5
+TEST_SECRET = "test_secret"
+TEST_SIGNED_BODY = b"test_payload"
 
-# Mock the dependencies before importing main
-with patch.dict(
-    "sys.modules",
+
+@lru_cache(maxsize=32)
+def _expected_sig(secret: bytes, body: bytes) -> str:
+    """X-Hub-Signature-256 header GitHub would send; one SHA-256 per (secret, body) pair"""
+    return "sha256=" + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+VALID_SIGNATURE = _expected_sig(TEST_SECRET.encode(), TEST_SIGNED_BODY)
+
+# Webhook bodies, serialized once; tests post these bytes as-is
+JSON_HEADERS = {"Content-Type": "application/json"}
+SUCCESS_BODY = json.dumps(
+    {
+        "pull_request": {"number": TEST_PR_NUMBER_1, "title": "Fix bug in authentication"},
+        "analysis": {
+            "risk_score": TEST_MEDIUM_RISK_SCORE,
+            "checks_passed": True,
+            "coverage_delta": TEST_COVERAGE_DELTA_POSITIVE,
+        },
+        "changes": {"files": ["auth.py", "test_auth.py"]},
+    }
+).encode()
+CODEX_FAILURE_BODY = json.dumps(
+    {
+        "pull_request": {"number": TEST_PR_NUMBER_2, "title": "Test PR"},
+        "analysis": {"risk_score": TEST_LOW_RISK_SCORE},
+        "changes": {"files": []},
+    }
+).encode()
+INVALID_SIGNATURE_BODY = json.dumps({"pull_request": {"number": TEST_PR_NUMBER_3}}).encode()
+EMPTY_BODY = b"{}"
+LOW_RISK_BODY = json.dumps(
+    {
+        "pull_request": {"number": TEST_PR_NUMBER_4},
+        "analysis": {"risk_score": TEST_LOW_RISK_THRESHOLD},
+    }
+).encode()
+MEDIUM_RISK_BODY = json.dumps(
+    {
+        "pull_request": {"number": TEST_PR_NUMBER_5},
+        "analysis": {"risk_score": TEST_HIGH_RISK_SCORE},
+    }
+).encode()
+MINIMAL_BODY = json.dumps(
     {
-        "nats.aio.client": MagicMock(),
-        "temporalio.client": MagicMock(),
-        "temporalio.worker": MagicMock(),
-        "prometheus_client": MagicMock(),
-    },
-):
-    from main import PRAudit, _verify_signature, app
+        "pull_request": {"number": TEST_PR_NUMBER_1, "title": "docs: update readme"},
+        "analysis": {"risk_score": TEST_VERY_LOW_RISK_SCORE, "checks_passed": True},
+        "changes": {"files": ["README.md"]},
+    }
+).encode()
+MISSING_PR_BODY = json.dumps({"action": "opened", "repository": {"name": "test-repo"}}).encode()
+INVALID_RISK_SCORE_BODY = json.dumps(
+    {
+        "action": "opened",
+        "pull_request": {"number": TEST_PR_NUMBER_1},
+        "analysis": {"risk_score": "invalid"},
+    }
+).encode()
+CODEX_UNAVAILABLE_BODY = json.dumps(
+    {"action": "opened", "pull_request": {"number": TEST_PR_NUMBER_1, "title": "Test PR"}}
+).encode()
 
 client = TestClient(app)
 
 
-class TestSignatureVerification:
-    def test_verify_signature_empty_secret_demo_mode(self):
-        """Test that empty secret allows all requests (demo mode)"""
-        result = _verify_signature("", "sha256=invalid", b"test")
-        assert result is True
+@pytest.fixture(scope="session", autouse=True)
+def _codex_transport():
+    """Serve Codex digests from one MockTransport-backed client for the whole session"""
+    captured = []
 
-    def test_verify_signature_valid(self):
-        """Test valid signature verification"""
-        secret = "test_secret"
-        body = b"test_payload"
-        mac = hmac.new(secret.encode(), msg=body, digestmod=hashlib.sha256).hexdigest()
-        signature = f"sha256={mac}"
+    def handler(request):
+        captured.append(request)
+        return httpx.Response(HTTP_OK, json={})
 
-        result = _verify_signature(secret, signature, body)
-        assert result is True
+    app.state.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    yield captured
+    asyncio.run(app.state.http_client.aclose())
 
-    def test_verify_signature_invalid(self):
-        """Test invalid signature rejection"""
-        result = _verify_signature("secret", "sha256=invalid", b"test")
-        assert result is False
 
-    def test_verify_signature_missing_prefix(self):
-        """Test signature without sha256 prefix"""
-        result = _verify_signature("secret", "invalid", b"test")
-        assert result is False
+@pytest.fixture
+def codex_requests(_codex_transport):
+    """Requests sent to Codex during the current test"""
+    _codex_transport.clear()
+    return _codex_transport
 
-    def test_verify_signature_none_signature(self):
-        """Test None signature"""
-        result = _verify_signature("secret", None, b"test")
-        assert result is False
 
+@pytest.fixture
+def codex_unreachable(monkeypatch):
+    """Make every Codex post fail to connect"""
+
+    def handler(request):
+        raise httpx.ConnectError("Connection refused", request=request)
+
+    unreachable = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(app.state, "http_client", unreachable)
+    yield
+    asyncio.run(unreachable.aclose())
+
+
+class _FakeNATS:
+    """NATS client stand-in that records what it is asked to do"""
+
+    def __init__(self, publish_error=None):
+        self.publish_error = publish_error
+        self.servers = None
+        self.published = []
+        self.flushes = 0
+        self.closed = False
+
+    async def connect(self, servers):
+        self.servers = servers
+
+    async def publish(self, subject, data):
+        if self.publish_error is not None:
+            raise self.publish_error
+        self.published.append((subject, data))
+
+    async def flush(self):
+        self.flushes += 1
+
+    async def close(self):
+        self.closed = True
+
+
+def _fake_temporal():
+    """Temporal client stand-in; records the address it connected to and close()"""
+    temporal = SimpleNamespace(connected_to=None, closed=False)
+
+    async def connect(address):
+        temporal.connected_to = address
+        return temporal
+
+    async def close():
+        temporal.closed = True
+
+    temporal.connect = connect
+    temporal.close = close
+    return temporal
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def started_app(monkeypatch):
+    """Run the startup event against fake NATS/Temporal clients, shutting down afterwards"""
+    clients = SimpleNamespace(nats=_FakeNATS(), temporal=_fake_temporal(), metrics_ports=[])
+    monkeypatch.setattr(main, "NATS", lambda: clients.nats)
+    monkeypatch.setattr(main, "Temporal", clients.temporal)
+    monkeypatch.setattr(main, "start_metrics_server", clients.metrics_ports.append)
+    # Startup replaces the shared Codex client; put the session one back afterwards
+    monkeypatch.setattr(app.state, "http_client", app.state.http_client)
+    await startup_event()
+    yield clients
+    if not clients.nats.closed:
+        await shutdown_event()
+
+
+async def _drain_once(nats, messages):
+    """Feed messages through the publish drain task and wait for them to be handled"""
+    queue = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+    task = asyncio.create_task(_drain_publish_queue(nats, queue))
+    await queue.join()
+    task.cancel()
+
+
+async def _post_webhook(aclient, body, headers=None):
+    """POST pre-serialized JSON bytes to the GitHub webhook and let the Codex post finish"""
+    response = await aclient.post(
+        "/webhook/github", content=body, headers={**JSON_HEADERS, **(headers or {})}
+    )
+    await _wait_codex_tasks()
+    return response
+
+
+def _sent_payload(codex_requests):
+    """Decode the digest body the webhook posted to Codex"""
+    return json.loads(codex_requests[-1].content)
+
+
+class TestSignatureVerification:
+    @pytest.mark.parametrize(
+        ("secret", "signature", "body", "expected"),
+        [
+            ("", "sha256=invalid", b"test", True),
+            (TEST_SECRET, VALID_SIGNATURE, TEST_SIGNED_BODY, True),
+            ("secret", "sha256=invalid", b"test", False),
+            ("secret", "invalid", b"test", False),
+            ("secret", None, b"test", False),
+            ("secret", "sha256=" + "zz" * 32, b"test", False),
+            (TEST_SECRET, VALID_SIGNATURE.encode(), TEST_SIGNED_BODY, True),
+        ],
+        ids=[
+            "empty_secret_demo_mode",
+            "valid",
+            "invalid",
+            "missing_prefix",
+            "none_signature",
+            "non_hex_digest",
+            "valid_bytes_header",
+        ],
+    )
+    def test_verify_signature(self, secret, signature, body, expected):
+        """Test signature verification across valid and rejected headers"""
+        assert _verify_signature(secret, signature, body) is expected
 
-class TestPRAuditModel:
-    def test_pr_audit_defaults(self):
-        """Test PRAudit model with minimal data"""
-        audit = PRAudit(number=TEST_PR_NUMBER_1)
-        assert audit.number == TEST_PR_NUMBER_1
-        assert audit.title is None
-        assert audit.labels == []
-        assert audit.risk_score == DEFAULT_RISK_SCORE
-        assert audit.checks_passed is False
 
+class TestPRAuditModel:
     def test_pr_audit_full_data(self):
         """Test PRAudit model with complete data"""
         audit = PRAudit(
@@ -121,101 +287,78 @@ class TestPRAuditModel:
 
 
 class TestWebhookEndpoint:
-    @patch("main.httpx.AsyncClient")
-    def test_webhook_success(self, mock_client):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_webhook_success(self, aclient, codex_requests):
         """Test successful webhook processing"""
-        # Mock the async client
-        mock_async_client = AsyncMock()
-        mock_client.return_value.__aenter__.return_value = mock_async_client
-        mock_async_client.post = AsyncMock()
-
-        payload = {
-            "pull_request": {"number": TEST_PR_NUMBER_1, "title": "Fix bug in authentication"},
-            "analysis": {
-                "risk_score": TEST_MEDIUM_RISK_SCORE,
-                "checks_passed": True,
-                "coverage_delta": TEST_COVERAGE_DELTA_POSITIVE,
-            },
-            "changes": {"files": ["auth.py", "test_auth.py"]},
-        }
-
-        response = client.post(
-            "/webhook/github",
-            json=payload,
+        response = await _post_webhook(
+            aclient,
+            SUCCESS_BODY,
             headers={"X-GitHub-Event": "pull_request", "X-GitHub-Delivery": "test-delivery-123"},
         )
 
         assert response.status_code == HTTP_OK
-        data = response.json()
-        assert data["ok"] is True
-        assert data["codex"] == TEST_PR_NUMBER_1
-        assert data["delivery"] == "test-delivery-123"
+        assert response.json() == {"status": "processed", "delivery_id": "test-delivery-123"}
 
         # Verify codex was called
-        mock_async_client.post.assert_called_once()
-        call_args = mock_async_client.post.call_args
-        assert "codex/pr-digest" in call_args[0][0]
-
-    @patch("main.httpx.AsyncClient")
-    def test_webhook_codex_failure(self, mock_client):
+        assert len(codex_requests) == 1
+        assert codex_requests[0].url.path == "/codex/pr-digest"
+        digest = PRAudit.model_validate(_sent_payload(codex_requests))
+        assert digest.number == TEST_PR_NUMBER_1
+        assert digest.changed_paths == ["auth.py", "test_auth.py"]
+
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_webhook_codex_failure(self, aclient, codex_unreachable):
         """Test webhook when codex service is unreachable"""
-        # Mock the async client to raise an exception
-        mock_async_client = AsyncMock()
-        mock_client.return_value.__aenter__.return_value = mock_async_client
-        mock_async_client.post.side_effect = Exception("Connection refused")
-
-        payload = {
-            "pull_request": {"number": TEST_PR_NUMBER_2, "title": "Test PR"},
-            "analysis": {"risk_score": TEST_LOW_RISK_SCORE},
-            "changes": {"files": []},
-        }
-
-        response = client.post("/webhook/github", json=payload)
+        response = await _post_webhook(aclient, CODEX_FAILURE_BODY)
 
+        # The Codex digest is best-effort; the webhook is still processed
         assert response.status_code == HTTP_OK
-        data = response.json()
-        assert data["ok"] is False
-        assert "codex_unreachable" in data["reason"]
+        assert response.json()["status"] == "processed"
 
-    def test_webhook_invalid_json(self):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_webhook_invalid_json(self, aclient):
         """Test webhook with invalid JSON"""
-        response = client.post(
-            "/webhook/github", data="invalid json", headers={"Content-Type": "application/json"}
+        response = await aclient.post(
+            "/webhook/github", content=b"invalid json", headers=JSON_HEADERS
         )
 
         assert response.status_code == HTTP_BAD_REQUEST
         assert "invalid json" in response.json()["detail"]
 
-    @patch("main.WEBHOOK_SECRET", "test_secret")
-    def test_webhook_invalid_signature(self):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_webhook_invalid_signature(self, aclient, monkeypatch):
         """Test webhook with invalid signature"""
-        payload = {"pull_request": {"number": TEST_PR_NUMBER_3}}
-
-        response = client.post(
-            "/webhook/github", json=payload, headers={"X-Hub-Signature-256": "sha256=invalid"}
+        monkeypatch.setattr(main, "WEBHOOK_SECRET", TEST_SECRET)
+        response = await _post_webhook(
+            aclient, INVALID_SIGNATURE_BODY, headers={"X-Hub-Signature-256": "sha256=invalid"}
         )
 
         assert response.status_code == HTTP_UNAUTHORIZED
         assert "invalid signature" in response.json()["detail"]
 
-    def test_webhook_missing_data(self):
-        """Test webhook with minimal/missing data"""
-        payload = {}  # Empty payload
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_webhook_valid_signature(self, aclient, codex_requests, monkeypatch):
+        """Test webhook accepts a correctly signed delivery"""
+        monkeypatch.setattr(main, "WEBHOOK_SECRET", TEST_SECRET)
+        response = await _post_webhook(
+            aclient,
+            SUCCESS_BODY,
+            headers={"X-Hub-Signature-256": _expected_sig(TEST_SECRET.encode(), SUCCESS_BODY)},
+        )
 
-        with patch("main.httpx.AsyncClient") as mock_client:
-            mock_async_client = AsyncMock()
-            mock_client.return_value.__aenter__.return_value = mock_async_client
-            mock_async_client.post = AsyncMock()
+        assert response.status_code == HTTP_OK
+        assert _sent_payload(codex_requests)["number"] == TEST_PR_NUMBER_1
 
-            response = client.post("/webhook/github", json=payload)
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_webhook_missing_data(self, aclient, codex_requests):
+        """Test webhook with minimal/missing data"""
+        response = await _post_webhook(aclient, EMPTY_BODY)
 
         assert response.status_code == HTTP_OK
-        data = response.json()
-        assert data["ok"] is True
+        assert response.json()["status"] == "processed"
 
         # Verify the payload sent to codex has defaults
-        call_args = mock_async_client.post.call_args
-        sent_payload = call_args[1]["json"]
+        sent_payload = _sent_payload(codex_requests)
         assert sent_payload["number"] == DEFAULT_PR_NUMBER  # Default when no PR number
         assert sent_payload["title"] == DEFAULT_TITLE  # Default when no title
         assert sent_payload["risk_score"] == DEFAULT_RISK_SCORE  # Default risk score
@@ -230,69 +373,34 @@ class TestHealthEndpoint:
 
 
 class TestRiskLabeling:
-    @patch("main.httpx.AsyncClient")
-    def test_low_risk_labeling(self, mock_client):
-        """Test that low risk scores get risk:low label"""
-        mock_async_client = AsyncMock()
-        mock_client.return_value.__aenter__.return_value = mock_async_client
-        mock_async_client.post = AsyncMock()
-
-        payload = {
-            "pull_request": {"number": TEST_PR_NUMBER_4},
-            "analysis": {"risk_score": TEST_LOW_RISK_THRESHOLD},
-        }  # Low risk
-
-        response = client.post("/webhook/github", json=payload)
+    @pytest.mark.asyncio(loop_scope="session")
+    @pytest.mark.parametrize(
+        ("body", "expected_label"),
+        [(LOW_RISK_BODY, "risk:low"), (MEDIUM_RISK_BODY, "risk:med")],
+        ids=["low_risk", "medium_risk"],
+    )
+    async def test_risk_labeling(self, aclient, codex_requests, body, expected_label):
+        """Test that risk scores at or below the threshold get risk:low, others risk:med"""
+        response = await _post_webhook(aclient, body)
         assert response.status_code == HTTP_OK
 
         # Check the payload sent to codex
-        call_args = mock_async_client.post.call_args
-        sent_payload = call_args[1]["json"]
-        assert "risk:low" in sent_payload["labels"]
-
-    @patch("main.httpx.AsyncClient")
-    def test_medium_risk_labeling(self, mock_client):
-        """Test that medium/high risk scores get risk:med label"""
-        mock_async_client = AsyncMock()
-        mock_client.return_value.__aenter__.return_value = mock_async_client
-        mock_async_client.post = AsyncMock()
-
-        payload = {
-            "pull_request": {"number": TEST_PR_NUMBER_5},
-            "analysis": {"risk_score": TEST_HIGH_RISK_SCORE},
-        }  # High risk
-
-        response = client.post("/webhook/github", json=payload)
-        assert response.status_code == HTTP_OK
-
-        # Check the payload sent to codex
-        call_args = mock_async_client.post.call_args
-        sent_payload = call_args[1]["json"]
-        assert "risk:med" in sent_payload["labels"]
+        assert expected_label in _sent_payload(codex_requests)["labels"]
 
 
 # Legacy test for backward compatibility
-def test_webhook_minimal_happy_path():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_webhook_minimal_happy_path(aclient, codex_requests):
     """Original test maintained for compatibility"""
-    with patch("main.httpx.AsyncClient") as mock_client:
-        mock_async_client = AsyncMock()
-        mock_client.return_value.__aenter__.return_value = mock_async_client
-        mock_async_client.post = AsyncMock()
-
-        payload = {
-            "pull_request": {"number": TEST_PR_NUMBER_1, "title": "docs: update readme"},
-            "analysis": {"risk_score": TEST_VERY_LOW_RISK_SCORE, "checks_passed": True},
-            "changes": {"files": ["README.md"]},
-        }
-
-        response = client.post("/webhook/github", json=payload)
-        assert response.status_code == HTTP_OK
-        assert response.json()["ok"] is True
+    response = await _post_webhook(aclient, MINIMAL_BODY)
+    assert response.status_code == HTTP_OK
+    assert response.json()["status"] == "processed"
 
 
-def test_webhook_bad_json():
+@pytest.mark.asyncio(loop_scope="session")
+async def test_webhook_bad_json(aclient):
     """Original test for bad JSON"""
-    response = client.post("/webhook/github", data="not-json")
+    response = await aclient.post("/webhook/github", content=b"not-json")
     assert response.status_code == HTTP_BAD_REQUEST
 
 
@@ -352,70 +460,57 @@ class TestRiskScoring:
 class TestNATSIntegration:
     """Test NATS messaging integration"""
 
-    @patch("main.nats_client")
-    async def test_nats_message_publishing_success(self, mock_nats):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_nats_message_publishing_success(self):
         """Test successful NATS message publishing"""
-        mock_nats.publish = AsyncMock()
-
-        # This would be tested in an async context in real implementation
+        nats = _FakeNATS()
         subject = "gh.pull_request.opened"
-        payload = {"test": "data"}
+        data = json.dumps({"test": "data"}).encode()
+
+        await _drain_once(nats, [(subject, data)])
 
-        await mock_nats.publish(subject, json.dumps(payload).encode())
-        mock_nats.publish.assert_called_once_with(subject, json.dumps(payload).encode())
+        assert nats.published == [(subject, data)]
+        assert nats.flushes == 1
 
-    @patch("main.nats_client")
-    async def test_nats_message_publishing_failure(self, mock_nats):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_nats_message_publishing_failure(self):
         """Test NATS message publishing failure handling"""
-        mock_nats.publish = AsyncMock(side_effect=Exception("NATS connection failed"))
+        nats = _FakeNATS(publish_error=Exception("NATS connection failed"))
 
-        with pytest.raises(Exception, match="NATS connection failed"):
-            await mock_nats.publish("test.subject", b"test data")
+        # A failed publish is logged and the queue still drains
+        await _drain_once(nats, [("test.subject", b"test data")])
+
+        assert nats.published == []
+        assert nats.flushes == 0
 
     def test_nats_subject_generation(self):
         """Test NATS subject generation from GitHub events"""
-        event_type = "pull_request"
-        action = "opened"
-        expected_subject = f"gh.{event_type}.{action}"
-
-        assert expected_subject == "gh.pull_request.opened"
+        assert _nats_subject("pull_request", "opened") == "gh.pull_request.opened"
 
 
 class TestTemporalIntegration:
     """Test Temporal workflow integration"""
 
-    @patch("main.temporal_client")
-    async def test_temporal_client_connection(self, mock_temporal):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_temporal_client_connection(self, started_app):
         """Test Temporal client connection"""
-        mock_temporal.connect = AsyncMock(return_value=mock_temporal)
-
-        client = await mock_temporal.connect(f"temporal:{TEST_TEMPORAL_PORT}")
-        assert client is not None
-        mock_temporal.connect.assert_called_once_with(f"temporal:{TEST_TEMPORAL_PORT}")
+        assert app.state.temporal_client is started_app.temporal
+        assert started_app.temporal.connected_to == main.TEMPORAL_ADDRESS
 
-    @patch("main.temporal_client")
-    async def test_temporal_workflow_start(self, mock_temporal):
-        """Test starting Temporal workflows"""
-        mock_workflow = AsyncMock()
-        mock_temporal.start_workflow = AsyncMock(return_value=mock_workflow)
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_temporal_client_closed_on_shutdown(self, started_app):
+        """Test the Temporal client is closed when the app shuts down"""
+        await shutdown_event()
 
-        workflow = await mock_temporal.start_workflow("test_workflow", {"data": "test"})
-        assert workflow is not None
-        mock_temporal.start_workflow.assert_called_once_with("test_workflow", {"data": "test"})
+        assert started_app.temporal.closed is True
 
 
 class TestMetricsIntegration:
     """Test Prometheus metrics integration"""
 
-    @patch("main.record_webhook_event")
-    def test_webhook_metrics_recording(self, mock_record):
+    def test_webhook_metrics_recording(self):
         """Test that webhook events are properly recorded in metrics"""
-        mock_record.return_value = None
-
-        # Simulate calling the metrics function
-        from main import record_webhook_event
-
-        record_webhook_event("pull_request", "opened", True, TEST_METRICS_SCORE)
+        main.record_webhook_event("pull_request", "opened", True, TEST_METRICS_SCORE)
 
         # In real implementation, this would verify the metrics were recorded
         assert True  # Placeholder for actual metrics verification
@@ -426,14 +521,9 @@ class TestMetricsIntegration:
         assert response.status_code == 200
         assert "text/plain" in response.headers.get("content-type", "")
 
-    @patch("main.record_codex_request")
-    def test_codex_request_metrics(self, mock_record):
+    def test_codex_request_metrics(self):
         """Test Codex request metrics recording"""
-        mock_record.return_value = None
-
-        from main import record_codex_request
-
-        record_codex_request("/codex/pr-digest", HTTP_OK, TEST_RESPONSE_TIME)
+        main.record_codex_request("/codex/pr-digest", HTTP_OK, TEST_RESPONSE_TIME)
 
         # Verify metrics recording was called
         assert True  # Placeholder for actual verification
@@ -442,53 +532,32 @@ class TestMetricsIntegration:
 class TestErrorHandling:
     """Test error handling and edge cases"""
 
-    def test_missing_pr_data(self):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_missing_pr_data(self, aclient):
         """Test handling of missing PR data in webhook"""
-        payload = {
-            "action": "opened",
-            "repository": {"name": "test-repo"},
-            # Missing pull_request data
-        }
-
-        response = client.post(
-            "/webhook/github", json=payload, headers={"x-github-event": "pull_request"}
+        # No pull_request data
+        response = await _post_webhook(
+            aclient, MISSING_PR_BODY, headers={"x-github-event": "pull_request"}
         )
 
         # Should handle gracefully with defaults
         assert response.status_code == HTTP_OK
 
-    def test_invalid_risk_score_data(self):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_invalid_risk_score_data(self, aclient):
         """Test handling of invalid risk score data"""
-        payload = {
-            "action": "opened",
-            "pull_request": {"number": TEST_PR_NUMBER_1},
-            "analysis": {"risk_score": "invalid"},
-        }
-
-        response = client.post(
-            "/webhook/github", json=payload, headers={"x-github-event": "pull_request"}
+        response = await _post_webhook(
+            aclient, INVALID_RISK_SCORE_BODY, headers={"x-github-event": "pull_request"}
         )
 
         # Should handle gracefully with default risk score
         assert response.status_code == HTTP_OK
 
-    @patch("main.httpx.AsyncClient")
-    def test_codex_service_unavailable(self, mock_client):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_codex_service_unavailable(self, aclient, codex_unreachable):
         """Test handling when Codex service is unavailable"""
-        mock_response = MagicMock()
-        mock_response.status_code = HTTP_SERVICE_UNAVAILABLE
-
-        mock_async_client = AsyncMock()
-        mock_async_client.post = AsyncMock(side_effect=httpx.ConnectError("Connection failed"))
-        mock_client.return_value.__aenter__.return_value = mock_async_client
-
-        payload = {
-            "action": "opened",
-            "pull_request": {"number": TEST_PR_NUMBER_1, "title": "Test PR"},
-        }
-
-        response = client.post(
-            "/webhook/github", json=payload, headers={"x-github-event": "pull_request"}
+        response = await _post_webhook(
+            aclient, CODEX_UNAVAILABLE_BODY, headers={"x-github-event": "pull_request"}
         )
 
         # Should continue processing even if Codex fails
@@ -512,7 +581,7 @@ class TestDataModels:
             "perf_delta": TEST_PERF_DELTA_POSITIVE,
         }
 
-        pr_audit = PRAudit(**valid_data)
+        pr_audit = PRAudit.model_validate(valid_data)
         assert pr_audit.number == TEST_PR_NUMBER_1
         assert pr_audit.title == "Test PR"
         assert len(pr_audit.labels) == 2
@@ -534,31 +603,30 @@ class TestDataModels:
         assert pr_audit.release_window_state == "open"
         assert pr_audit.summary == ""
 
+    def test_pr_audit_model_is_frozen(self):
+        """Test PRAudit instances cannot be mutated after validation"""
+        pr_audit = PRAudit.model_validate({"number": TEST_PR_NUMBER_1})
+
+        with pytest.raises(ValidationError):
+            pr_audit.risk_score = TEST_HIGH_RISK_SCORE
+
 
 class TestStartupShutdown:
     """Test application startup and shutdown events"""
 
-    @patch("main.NATS")
-    @patch("main.Temporal")
-    @patch("main.start_metrics_server")
-    async def test_startup_event_success(self, mock_metrics, mock_temporal, mock_nats):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_startup_event_success(self, started_app):
         """Test successful startup event"""
-        mock_nats_instance = AsyncMock()
-        mock_nats.return_value = mock_nats_instance
-        mock_nats_instance.connect = AsyncMock()
-
-        mock_temporal_instance = AsyncMock()
-        mock_temporal.connect = AsyncMock(return_value=mock_temporal_instance)
-
-        # This would test the actual startup event in a real async test
-        assert True  # Placeholder for actual startup testing
+        assert app.state.nats_client is started_app.nats
+        assert started_app.nats.servers == [main.NATS_URL]
+        assert app.state.publish_task is not None
+        assert started_app.metrics_ports
 
-    @patch("main.nats_client")
-    @patch("main.temporal_client")
-    async def test_shutdown_event(self, mock_temporal, mock_nats):
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_shutdown_event(self, started_app):
         """Test shutdown event cleanup"""
-        mock_nats.close = AsyncMock()
-        mock_temporal.close = AsyncMock()
+        await shutdown_event()
 
-        # This would test the actual shutdown event
-        assert True  # Placeholder for actual shutdown testing
+        assert started_app.nats.closed is True
+        assert started_app.temporal.closed is True
+        assert app.state.publish_task is None
@@ -1,31 +1,49 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import datetime as dt
-import json
+import functools
 import os
 import pathlib
+import re
 import subprocess
 import time
 from typing import Any
 
-import psycopg
-from embeddings import embed, store_embedding
+import numpy as np
+import orjson
+from embeddings import DEFAULT_MODEL, embed_batch, text_hash
 from metrics import metrics_activity, record_docs_generation, record_graph_update
 from owners_emit import emit_owners_index
-from ownership import get_owner_type, normalize_owner_handle, owner_for, parse_codeowners
+from ownership import compile_codeowners, get_owner_type, normalize_owner_handle
+from pgvector.psycopg import register_vector
 from policy_explain import render_policy_block
+from pr_graph import _mermaid
 from prometheus_client import Histogram
 from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb, set_json_dumps
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 from slugify import slugify
 from temporalio import activity
 
 # Constants for magic numbers
-MAX_CHANGED_FILES_DISPLAY = 20
-MAX_POLICIES_DISPLAY = 10
-MAX_FILENAME_LENGTH = 30
-MAX_POLICY_NAME_LENGTH = 20
 DEFAULT_VECTOR_DIMENSION = 1536
 DEFAULT_CLEANUP_DAYS = 90
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = 16
+# Hot upserts reuse identical SQL, so prepare server-side on first execution; psycopg counts
+# earlier executions, so 0 prepares on the first and 1 would wait for the second
+DB_PREPARE_THRESHOLD = 0
+# Graph batches above this many rows are bulk-loaded with COPY instead of INSERT
+GRAPH_COPY_MIN_ROWS = 200
+# Documents sent to the embedding router per request
+EMBED_BATCH_SIZE = 64
+# How long a render waits for concurrent renders to join its embedding batch (seconds)
+EMBED_LINGER_SECONDS = 0.05
+
+# JSONB parameters (node/edge data) are serialized with orjson rather than the stdlib encoder
+set_json_dumps(functools.partial(orjson.dumps, option=orjson.OPT_NON_STR_KEYS))
 
 # Prometheus metrics
 DOC_FRESH = Histogram(
@@ -38,17 +56,25 @@ DOC_FRESH = Histogram(
 REDACT = [
     (r"AKIA[0-9A-Z]{16}", "‹AWS_KEY_REDACTED›"),
     (r"ghp_[0-9A-Za-z]{36,40}(?![0-9A-Za-z])", "‹GH_TOKEN_REDACTED›"),
-    (r"(?:ssh-rsa|ssh-ed25519)\s+[A-Za-z0-9/+]+={0,3}", "‹SSH_KEY_REDACTED›"),
+    # The key body is taken greedily to the end of its run, however long, and nothing after it
+    # can fail, so a match never backtracks; only the separator is bounded
+    (r"(?:ssh-rsa|ssh-ed25519)\s{1,16}[A-Za-z0-9/+]{16,}={0,3}", "‹SSH_KEY_REDACTED›"),
 ]
 
 
+# All patterns compiled into one alternation so a document is scanned once;
+# the named group that matched selects the replacement
+_REDACT_RE = re.compile("|".join(f"(?P<r{i}>{pat})" for i, (pat, _) in enumerate(REDACT)))
+_REDACT_REPL = {f"r{i}": repl for i, (_, repl) in enumerate(REDACT)}
+
+
+def _redact_match(match: re.Match[str]) -> str:
+    return _REDACT_REPL[match.lastgroup]
+
+
 def _scrub(text: str) -> str:
     """Redact sensitive information from text content."""
-    import re
-
-    for pat, repl in REDACT:
-        text = re.sub(pat, repl, text)
-    return text
+    return _REDACT_RE.sub(_redact_match, text)
 
 
 DB_URL = os.getenv("DATABASE_URL")
@@ -57,54 +83,94 @@ DOCS_DIR = pathlib.Path(os.getenv("CODEX_DOCS_DIR", str(REPO_ROOT / "docs"))).re
 SITE_DIR = pathlib.Path(os.getenv("CODEX_PORTAL_SITE_DIR", str(REPO_ROOT / "site"))).resolve()
 GITHUB_WEB_BASE = os.getenv("GITHUB_WEB_BASE", "")
 
+# Feature flags are fixed for the life of the worker process
+OWNERS_ENABLED = os.getenv("CODEX_OWNERS_ENABLED", "false").lower() == "true"
+EMBEDDINGS_ENABLED = os.getenv("CODEX_EMBEDDINGS_ENABLED", "false").lower() == "true"
+
+# docs/owners.md markers around the generated ownership table
+OWNERS_TABLE_START = "<!-- OWNERS_TABLE_START -->"
+OWNERS_TABLE_END = "<!-- OWNERS_TABLE_END -->"
+
+# Landing page written once per worker process
+DOCS_INDEX = "# GitGuard Codex\n\nWelcome to the living org-brain.\n"
+
+
+@functools.cache
+def _pool() -> ConnectionPool:
+    """Process-wide connection pool, opened on first use so imports never touch the DB."""
+    return ConnectionPool(
+        DB_URL or "",
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        # Default tuple rows; hot paths read columns by position
+        kwargs={
+            "autocommit": True,
+            "prepare_threshold": DB_PREPARE_THRESHOLD,
+        },
+        # Adapts numpy arrays to the vector/halfvec types in binary form
+        configure=register_vector,
+        open=True,
+    )
+
 
 def _conn():
-    return psycopg.connect(DB_URL, row_factory=dict_row, autocommit=True)
-
-
-def _mermaid(pr_num: int, changed: list[str], policies: list[str]) -> str:
-    """Generate Mermaid graph showing PR touches and governance relationships."""
-    lines = ["```mermaid", "graph LR", f'  PR["PR #{pr_num}"]']
-    for file_idx, file_path in enumerate(
-        changed[:MAX_CHANGED_FILES_DISPLAY]
-    ):  # cap to keep it readable
-        display_name = (
-            "..." + file_path[-MAX_FILENAME_LENGTH:]
-            if len(file_path) > MAX_FILENAME_LENGTH
-            else file_path
-        )
-        lines.append(f'  PR -->|touches| F{file_idx}["{display_name}"]')
-    for policy_idx, policy_name in enumerate((policies or [])[:MAX_POLICIES_DISPLAY]):
-        display_name = (
-            "..." + policy_name[-MAX_POLICY_NAME_LENGTH:]
-            if len(policy_name) > MAX_POLICY_NAME_LENGTH
-            else policy_name
-        )
-        lines.append(f'  PR -->|governed_by| P{policy_idx}["{display_name}"]')
-    lines.append("```")
-    return "\n".join(lines)
+    """Borrow a pooled connection; returned to the pool when the with-block exits."""
+    return _pool().connection()
+
+
+@functools.cache
+def _async_pool() -> AsyncConnectionPool:
+    """Pool for the async activities; created closed and opened by _aconn on the worker's loop."""
+    return AsyncConnectionPool(
+        DB_URL or "",
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        kwargs={
+            "autocommit": True,
+            "prepare_threshold": DB_PREPARE_THRESHOLD,
+        },
+        open=False,
+    )
 
 
-def _ensure_schema():
-    here = pathlib.Path(__file__).parent
-    with _conn() as c, c.cursor() as cur:
-        cur.execute((here / "graph_schema.sql").read_text())
+@contextlib.asynccontextmanager
+async def _aconn():
+    """Borrow an async pooled connection without blocking the event loop."""
+    pool = _async_pool()
+    if pool.closed:
+        # Racing tasks are fine: open() is a no-op once the pool is open
+        await pool.open()
+    async with pool.connection() as c:
+        yield c
 
 
-def _check_delivery_seen(delivery_id: str) -> bool:
-    """Check if delivery has been processed before."""
-    with _conn() as c, c.cursor() as cur:
-        cur.execute("SELECT 1 FROM codex_seen_deliveries WHERE delivery_id = %s", (delivery_id,))
-        return cur.fetchone() is not None
+_schema_lock = asyncio.Lock()
+_schema_ready = asyncio.Event()
 
 
-def _mark_delivery_seen(delivery_id: str) -> None:
-    """Mark delivery as processed."""
-    with _conn() as c, c.cursor() as cur:
-        cur.execute(
-            "INSERT INTO codex_seen_deliveries (delivery_id) VALUES (%s) ON CONFLICT (delivery_id) DO NOTHING",
+async def _ensure_schema():
+    # The DDL is all IF NOT EXISTS, so once per process is enough
+    if _schema_ready.is_set():
+        return
+    async with _schema_lock:
+        if _schema_ready.is_set():
+            return
+        here = pathlib.Path(__file__).parent
+        async with _aconn() as c, c.cursor() as cur:
+            await cur.execute((here / "graph_schema.sql").read_text())
+        _schema_ready.set()
+
+
+async def _claim_delivery(delivery_id: str) -> bool:
+    """Mark delivery as processed; False if it had been processed before."""
+    # A single insert is atomic against workers racing on the same delivery
+    async with _aconn() as c, c.cursor() as cur:
+        await cur.execute(
+            "INSERT INTO codex_seen_deliveries (delivery_id) VALUES (%s) "
+            "ON CONFLICT (delivery_id) DO NOTHING RETURNING delivery_id",
             (delivery_id,),
         )
+        return await cur.fetchone() is not None
 
 
 def _validate_vector_dimension(
@@ -114,56 +180,63 @@ def _validate_vector_dimension(
     return len(vector) == expected_dim
 
 
-def _cleanup_old_deliveries(days_to_keep: int = DEFAULT_CLEANUP_DAYS) -> None:
+async def _cleanup_old_deliveries(days_to_keep: int = DEFAULT_CLEANUP_DAYS) -> None:
     """Clean up old delivery records beyond retention period."""
-    with _conn() as c, c.cursor() as cur:
-        cur.execute(
-            "DELETE FROM codex_seen_deliveries WHERE received_at < now() - interval '%s days'",
+    async with _aconn() as c, c.cursor() as cur:
+        await cur.execute(
+            "DELETE FROM codex_seen_deliveries WHERE received_at < now() - make_interval(days => %s)",
             (days_to_keep,),
         )
 
 
-def _insert_embedding(
-    cur, node_id: str, vector: list[float], model: str = "text-embedding-3-large"
-) -> None:
-    """Insert embedding with vector dimension validation."""
-    if not _validate_vector_dimension(vector):
-        raise ValueError(f"Vector dimension {len(vector)} does not match expected dimension 1536")
+# Vectors are content-addressed: each distinct text is stored once and nodes reference it
+_INSERT_STAGED_EMBEDDING_BLOBS_SQL = """
+    INSERT INTO codex_embedding_blobs (text_hash, vector)
+    SELECT text_hash, vector FROM codex_embeddings_stage
+    ON CONFLICT (text_hash) DO NOTHING
+"""
 
-    cur.execute(
-        "INSERT INTO codex_embeddings (node_id, model, vector) VALUES (%s, %s, %s) ON CONFLICT (node_id) DO UPDATE SET model=EXCLUDED.model, vector=EXCLUDED.vector",
-        (node_id, model, vector),
+# Resolves each staged (ntype, nkey) to its node and upserts in one statement;
+# returns the keys that were stored, since nodes that don't exist yet are skipped
+_UPSERT_STAGED_EMBEDDINGS_SQL = """
+    WITH stored AS (
+        INSERT INTO codex_embeddings (node_id, model, text_hash)
+        SELECT n.id, s.model, s.text_hash
+        FROM codex_embeddings_stage s
+        JOIN codex_nodes n ON n.ntype = s.ntype AND n.nkey = s.nkey
+        ON CONFLICT (node_id) DO UPDATE SET model=EXCLUDED.model, text_hash=EXCLUDED.text_hash
+        RETURNING node_id
     )
+    SELECT n.ntype, n.nkey FROM stored JOIN codex_nodes n ON n.id = stored.node_id
+"""
+
+
+async def _cleanup_orphan_embedding_blobs() -> None:
+    """Drop embedding vectors that no node references any more."""
+    async with _aconn() as c, c.cursor() as cur:
+        await cur.execute(
+            "DELETE FROM codex_embedding_blobs b "
+            "WHERE NOT EXISTS (SELECT 1 FROM codex_embeddings e WHERE e.text_hash = b.text_hash)"
+        )
 
 
-def _cleanup_temporary_branch_edges(days_to_keep: int = DEFAULT_CLEANUP_DAYS) -> None:
+async def _cleanup_temporary_branch_edges(days_to_keep: int = DEFAULT_CLEANUP_DAYS) -> None:
     """Clean up edges from temporary branches beyond retention period."""
-    with _conn() as c, c.cursor() as cur:
-        # Remove edges from nodes that represent temporary branches (feature/, hotfix/, etc.)
-        cur.execute(
+    async with _aconn() as c, c.cursor() as cur:
+        # Remove nodes that represent temporary branches (feature/, hotfix/, etc.)
+        # together with their edges, in one statement
+        await cur.execute(
             """
-            DELETE FROM codex_edges
-            WHERE src IN (
-                SELECT id FROM codex_nodes
+            WITH del AS (
+                DELETE FROM codex_nodes
                 WHERE ntype = 'PR'
-                AND (data->>'branch_name' LIKE 'feature/%'
-                     OR data->>'branch_name' LIKE 'hotfix/%'
-                     OR data->>'branch_name' LIKE 'temp/%')
-                AND created_at < now() - interval '%s days'
+                AND (data->>'branch_name' LIKE 'feature/%%'
+                     OR data->>'branch_name' LIKE 'hotfix/%%'
+                     OR data->>'branch_name' LIKE 'temp/%%')
+                AND created_at < now() - make_interval(days => %s)
+                RETURNING id
             )
-        """,
-            (days_to_keep,),
-        )
-
-        # Also clean up the temporary branch nodes themselves
-        cur.execute(
-            """
-            DELETE FROM codex_nodes
-            WHERE ntype = 'PR'
-            AND (data->>'branch_name' LIKE 'feature/%'
-                 OR data->>'branch_name' LIKE 'hotfix/%'
-                 OR data->>'branch_name' LIKE 'temp/%')
-            AND created_at < now() - interval '%s days'
+            DELETE FROM codex_edges WHERE src IN (SELECT id FROM del)
         """,
             (days_to_keep,),
         )
@@ -178,11 +251,9 @@ async def extract_event_facts(event: dict[str, Any]) -> dict[str, Any]:
 
     # Check for delivery deduplication
     delivery_id = e.get("delivery_id") or e.get("id", "unknown")
-    if _check_delivery_seen(str(delivery_id)):
+    if not await _claim_delivery(str(delivery_id)):
         raise ValueError(f"Delivery {delivery_id} already processed")
 
-    # Mark delivery as seen
-    _mark_delivery_seen(str(delivery_id))
     repo = e.get("repository", {}).get("full_name") or e.get("repo", "")
     rname = repo.split("/")[-1] if repo else e.get("repo_name", "unknown")
     kind = e.get("event", e.get("type", "unknown"))
@@ -246,13 +317,20 @@ async def analyze_repo_state(repo: str, sha: str) -> dict[str, Any]:
     # You can extend with real AST, coverage/perf harvesters.
     repo_dir = REPO_ROOT
 
-    # changed files list can be computed from git if not provided
-    def git(args: list[str]) -> str:
-        return subprocess.check_output(["git", "-C", str(repo_dir), *args]).decode()
+    # changed files list can be computed from git if not provided;
+    # "A...B" diffs from the merge-base, so one git process covers both steps
+    async def git(args: list[str]) -> str:
+        # Awaiting the child keeps the worker serving other activities meanwhile
+        proc = await asyncio.create_subprocess_exec(
+            "git", "-C", str(repo_dir), *args, stdout=asyncio.subprocess.PIPE
+        )
+        out, _ = await proc.communicate()
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, ["git", *args])
+        return out.decode()
 
     try:
-        base = git(["merge-base", "origin/main", sha]).strip()
-        paths = git(["diff", "--name-only", f"{base}...{sha}"]).splitlines()
+        paths = (await git(["diff", "--name-only", f"origin/main...{sha}"])).splitlines()
     except Exception:
         paths = []
 
@@ -262,10 +340,10 @@ async def analyze_repo_state(repo: str, sha: str) -> dict[str, Any]:
 
     # Parse CODEOWNERS and determine file ownership (if owners feature is enabled)
     owners = {}
-    if os.getenv("CODEX_OWNERS_ENABLED", "false").lower() == "true":
+    if OWNERS_ENABLED:
         co = REPO_ROOT / ".github" / "CODEOWNERS"
-        rules = parse_codeowners(co.read_text()) if co.exists() else []
-        owners = {p: owner_for(p, rules) for p in paths}
+        compiled = compile_codeowners(co.read_text() if co.exists() else "")
+        owners = {p: compiled.owner_for(p) for p in paths}
 
     return {
         "paths": paths,
@@ -274,112 +352,195 @@ async def analyze_repo_state(repo: str, sha: str) -> dict[str, Any]:
     }
 
 
-def _upsert_node(cur, ntype: str, nkey: str, title: str, data: dict[str, Any]) -> str:
-    cur.execute(
-        """
-        INSERT INTO codex_nodes (ntype, nkey, title, data)
-        VALUES (%s,%s,%s,%s)
-        ON CONFLICT (ntype, nkey)
-        DO UPDATE SET title=EXCLUDED.title, data=codex_nodes.data || EXCLUDED.data, updated_at=now()
-        RETURNING id
-    """,
-        (ntype, nkey, title, json.dumps(data)),
-    )
-    return cur.fetchone()["id"]
-
-
-def _link(cur, src_id: str, dst_id: str, rel: str, data: dict[str, Any] | None = None):
-    cur.execute(
-        """
-        INSERT INTO codex_edges (src, dst, rel, data)
-        VALUES (%s,%s,%s,%s)
-        ON CONFLICT (src, dst, rel) DO NOTHING
-    """,
-        (src_id, dst_id, rel, json.dumps(data or {})),
-    )
-
-
-@activity.defn
-@metrics_activity
-async def update_graph(facts: dict[str, Any], analysis: dict[str, Any]) -> None:
-    _ensure_schema()
-    with _conn() as c, c.cursor() as cur:
-        kind = facts["kind"]
-        if kind == "PR":
-            pr_key = f"pr:{facts['number']}"
-            pr_title = facts.get("title") or f"PR #{facts['number']}"
-            pr_id = _upsert_node(cur, "PR", pr_key, pr_title, facts)
-
-            repo_id = _upsert_node(
-                cur, "Repo", facts["repo"], facts["repo_name"], {"full": facts["repo"]}
-            )
-            _link(cur, repo_id, pr_id, "has_pr")
-
-            for p in facts["changed_paths"] or analysis.get("paths", []):
-                f_id = _upsert_node(cur, "File", f"file:{p}", p, {"path": p})
-                _link(cur, pr_id, f_id, "touches")
-
-                # Create ownership relationships (if owners feature is enabled)
-                if os.getenv("CODEX_OWNERS_ENABLED", "false").lower() == "true":
-                    ownership = analysis.get("owners", {}).get(p)
-                    if ownership:
-                        pattern, handles = ownership
-                        for handle in handles:
-                            normalized_handle = normalize_owner_handle(handle)
-                            owner_type = get_owner_type(handle)
-                            owner_key = f"owner:{normalized_handle}"
-                            owner_title = (
-                                f"@{normalized_handle}"
-                                if owner_type == "user"
-                                else f"@{normalized_handle}"
-                            )
-                            owner_data = {
-                                "handle": normalized_handle,
-                                "type": owner_type,
-                                "original_handle": handle,
-                            }
-                            owner_id = _upsert_node(
-                                cur, "Owner", owner_key, owner_title, owner_data
-                            )
-                            _link(cur, owner_id, f_id, "owns", {"pattern": pattern})
+_UPSERT_NODE_SQL = """
+    INSERT INTO codex_nodes (ntype, nkey, title, data)
+    VALUES (%s,%s,%s,%s)
+    ON CONFLICT (ntype, nkey)
+    DO UPDATE SET title=EXCLUDED.title, data=codex_nodes.data || EXCLUDED.data, updated_at=now()
+    RETURNING id
+"""
 
-            for s in analysis.get("symbols", []):
-                skey = f"symbol:{s['path']}#{s['name']}"
-                s_id = _upsert_node(cur, "Symbol", skey, s["name"], s)
-                _link(cur, pr_id, s_id, "defines")
+_LINK_SQL = """
+    INSERT INTO codex_edges (src, dst, rel, data)
+    VALUES (%s,%s,%s,%s)
+    ON CONFLICT (src, dst, rel) DO NOTHING
+"""
 
-            for policy in facts.get("policies", []):
-                pol_id = _upsert_node(cur, "Policy", f"policy:{policy}", policy, {})
-                _link(cur, pr_id, pol_id, "governed_by")
+_UPSERT_STAGED_NODES_SQL = """
+    INSERT INTO codex_nodes (ntype, nkey, title, data)
+    SELECT ntype, nkey, title, data FROM codex_nodes_stage
+    ON CONFLICT (ntype, nkey)
+    DO UPDATE SET title=EXCLUDED.title, data=codex_nodes.data || EXCLUDED.data, updated_at=now()
+    RETURNING ntype, nkey, id
+"""
 
-            for adr in facts.get("adrs", []):
-                adr_id = _upsert_node(cur, "ADR", f"adr:{adr}", adr, {})
-                _link(cur, pr_id, adr_id, "governed_by")
+_LINK_STAGED_SQL = """
+    INSERT INTO codex_edges (src, dst, rel, data)
+    SELECT src, dst, rel, data FROM codex_edges_stage
+    ON CONFLICT (src, dst, rel) DO NOTHING
+"""
 
-            # Record graph update metrics
-            record_graph_update("pr_update")
 
-        elif kind == "Release":
-            rel_key = f"release:{facts['tag']}"
-            rel_id = _upsert_node(cur, "Release", rel_key, facts["title"], facts)
-            repo_id = _upsert_node(
-                cur, "Repo", facts["repo"], facts["repo_name"], {"full": facts["repo"]}
+class _GraphBatch:
+    """Nodes and edges for one graph update, written as two pipelined or COPY batches."""
+
+    def __init__(self) -> None:
+        self.nodes: list[tuple[str, str, str, dict[str, Any]]] = []
+        self.edges: dict[tuple[int, int, str], dict[str, Any] | None] = {}
+        self._handles: dict[tuple[str, str], int] = {}
+
+    def node(self, ntype: str, nkey: str, title: str, data: dict[str, Any]) -> int:
+        """Queue a node upsert; returns a handle for link()."""
+        handle = self._handles.get((ntype, nkey))
+        if handle is None:
+            self._handles[(ntype, nkey)] = len(self.nodes)
+            self.nodes.append((ntype, nkey, title, data))
+            return len(self.nodes) - 1
+        # Fold repeats the way sequential upserts would: last title wins, data merges like jsonb ||
+        prev = self.nodes[handle][3]
+        self.nodes[handle] = (ntype, nkey, title, {**prev, **data})
+        return handle
+
+    def link(self, src: int, dst: int, rel: str, data: dict[str, Any] | None = None) -> None:
+        # Repeated edges are ON CONFLICT DO NOTHING, so the first one queued wins
+        self.edges.setdefault((src, dst, rel), data)
+
+    async def write(self, cur) -> None:
+        if not self.nodes:
+            return
+        if max(len(self.nodes), len(self.edges)) > GRAPH_COPY_MIN_ROWS:
+            # The stage tables are ON COMMIT DROP, so they need an explicit transaction
+            async with cur.connection.transaction():
+                await self._copy(cur)
+            return
+        # executemany pipelines the statements; one result set per distinct node
+        await cur.executemany(
+            _UPSERT_NODE_SQL,
+            [(ntype, nkey, title, Jsonb(data)) for ntype, nkey, title, data in self.nodes],
+            returning=True,
+        )
+        ids = []
+        while True:
+            ids.append((await cur.fetchone())[0])
+            if not cur.nextset():
+                break
+
+        if self.edges:
+            await cur.executemany(
+                _LINK_SQL,
+                [
+                    (ids[src], ids[dst], rel, Jsonb(data or {}))
+                    for (src, dst, rel), data in self.edges.items()
+                ],
             )
-            _link(cur, repo_id, rel_id, "has_release")
 
-            # Record graph update metrics
-            record_graph_update("release_update")
+    async def _copy(self, cur) -> None:
+        """Bulk-load the batch through COPY into temp stages, then upsert each in one statement."""
+        # node() already folded repeats, so no key is upserted twice in one statement
+        await cur.execute(
+            "CREATE TEMP TABLE codex_nodes_stage (ntype TEXT, nkey TEXT, title TEXT, data JSONB) "
+            "ON COMMIT DROP"
+        )
+        async with cur.copy("COPY codex_nodes_stage (ntype, nkey, title, data) FROM STDIN") as cp:
+            for ntype, nkey, title, data in self.nodes:
+                await cp.write_row((ntype, nkey, title, Jsonb(data)))
+        await cur.execute(_UPSERT_STAGED_NODES_SQL)
+        key_ids = {(ntype, nkey): node_id for ntype, nkey, node_id in await cur.fetchall()}
+        ids = [key_ids[(ntype, nkey)] for ntype, nkey, _, _ in self.nodes]
+
+        if self.edges:
+            await cur.execute(
+                "CREATE TEMP TABLE codex_edges_stage (src UUID, dst UUID, rel TEXT, data JSONB) "
+                "ON COMMIT DROP"
+            )
+            async with cur.copy("COPY codex_edges_stage (src, dst, rel, data) FROM STDIN") as cp:
+                for (src, dst, rel), data in self.edges.items():
+                    await cp.write_row((ids[src], ids[dst], rel, Jsonb(data or {})))
+            await cur.execute(_LINK_STAGED_SQL)
 
 
 @activity.defn
 @metrics_activity
-async def render_docs(facts: dict[str, Any], analysis: dict[str, Any]) -> str:
-    start = time.time()
-    DOCS_DIR.mkdir(parents=True, exist_ok=True)
+async def update_graph(facts: dict[str, Any], analysis: dict[str, Any]) -> None:
+    await _ensure_schema()
+    batch = _GraphBatch()
+    kind = facts["kind"]
+    if kind == "PR":
+        pr_key = f"pr:{facts['number']}"
+        pr_title = facts.get("title") or f"PR #{facts['number']}"
+        pr = batch.node("PR", pr_key, pr_title, facts)
+
+        repo = batch.node("Repo", facts["repo"], facts["repo_name"], {"full": facts["repo"]})
+        batch.link(repo, pr, "has_pr")
+
+        for p in facts["changed_paths"] or analysis.get("paths", []):
+            f = batch.node("File", f"file:{p}", p, {"path": p})
+            batch.link(pr, f, "touches")
+
+            # Create ownership relationships (if owners feature is enabled)
+            if OWNERS_ENABLED:
+                ownership = analysis.get("owners", {}).get(p)
+                if ownership:
+                    pattern, handles = ownership
+                    for handle in handles:
+                        normalized_handle = normalize_owner_handle(handle)
+                        owner_type = get_owner_type(handle)
+                        owner_key = f"owner:{normalized_handle}"
+                        owner_title = (
+                            f"@{normalized_handle}"
+                            if owner_type == "user"
+                            else f"@{normalized_handle}"
+                        )
+                        owner_data = {
+                            "handle": normalized_handle,
+                            "type": owner_type,
+                            "original_handle": handle,
+                        }
+                        owner = batch.node("Owner", owner_key, owner_title, owner_data)
+                        batch.link(owner, f, "owns", {"pattern": pattern})
+
+        for s in analysis.get("symbols", []):
+            skey = f"symbol:{s['path']}#{s['name']}"
+            batch.link(pr, batch.node("Symbol", skey, s["name"], s), "defines")
+
+        for policy in facts.get("policies", []):
+            batch.link(pr, batch.node("Policy", f"policy:{policy}", policy, {}), "governed_by")
+
+        for adr in facts.get("adrs", []):
+            batch.link(pr, batch.node("ADR", f"adr:{adr}", adr, {}), "governed_by")
+
+    elif kind == "Release":
+        rel_key = f"release:{facts['tag']}"
+        rel = batch.node("Release", rel_key, facts["title"], facts)
+        repo = batch.node("Repo", facts["repo"], facts["repo_name"], {"full": facts["repo"]})
+        batch.link(repo, rel, "has_release")
+
+    async with _aconn() as c, c.cursor() as cur:
+        await batch.write(cur)
+
+    # Record graph update metrics
+    if kind == "PR":
+        record_graph_update("pr_update")
+    elif kind == "Release":
+        record_graph_update("release_update")
+
+
+@functools.cache
+def _ensure_docs_layout() -> None:
+    """Create the docs sections and index page; only the first render per process does the I/O."""
     # Ensure base sections
     (DOCS_DIR / "prs").mkdir(parents=True, exist_ok=True)
     (DOCS_DIR / "releases").mkdir(parents=True, exist_ok=True)
-    (DOCS_DIR / "index.md").write_text("# GitGuard Codex\n\nWelcome to the living org-brain.\n")
+    index = DOCS_DIR / "index.md"
+    if not index.exists() or index.read_text() != DOCS_INDEX:
+        index.write_text(DOCS_INDEX)
+
+
+@activity.defn
+@metrics_activity
+async def render_docs(facts: dict[str, Any], analysis: dict[str, Any]) -> str:
+    start = time.time()
+    await asyncio.to_thread(_ensure_docs_layout)
 
     if facts["kind"] == "PR":
         pr = facts
@@ -416,7 +577,7 @@ async def render_docs(facts: dict[str, Any], analysis: dict[str, Any]) -> str:
 
 {policy_md}
 """
-        p.write_text(_scrub(body))
+        await asyncio.to_thread(p.write_text, _scrub(body))
         record_docs_generation("pr_doc")
 
     if facts["kind"] == "Release":
@@ -431,20 +592,20 @@ async def render_docs(facts: dict[str, Any], analysis: dict[str, Any]) -> str:
 ## Notes
 {rel.get('body') or "_No notes provided._"}
 """
-        p.write_text(_scrub(release_body))
+        await asyncio.to_thread(p.write_text, _scrub(release_body))
         record_docs_generation("release_doc")
 
     # Update owners.md with current ownership data (if enabled)
-    if os.getenv("CODEX_OWNERS_ENABLED", "false").lower() == "true":
-        _update_owners_doc()
+    if OWNERS_ENABLED:
+        await _update_owners_doc()
 
     # Generate and store embeddings for PR content (if enabled)
-    if os.getenv("CODEX_EMBEDDINGS_ENABLED", "false").lower() == "true":
-        _generate_embeddings(facts)
+    if EMBEDDINGS_ENABLED:
+        await _embedding_batcher.add(facts)
 
     # Update owners index from graph data
     if facts["kind"] in ["PR", "Release"]:
-        emit_owners_index(DB_URL, str(DOCS_DIR))
+        await asyncio.to_thread(emit_owners_index, DB_URL, str(DOCS_DIR))
 
     # Record freshness metric
     DOC_FRESH.observe(time.time() - start)
@@ -452,85 +613,89 @@ async def render_docs(facts: dict[str, Any], analysis: dict[str, Any]) -> str:
     return str(DOCS_DIR)
 
 
-def _generate_embeddings(facts: dict[str, Any]) -> None:
+def _embedding_doc(facts: dict[str, Any]) -> tuple[str, str, str, str] | None:
     """
-    Generate and store embeddings for PR summaries and titles.
+    Select the text to embed for a PR or Release.
 
     Args:
         facts: The facts dictionary containing PR or Release information
-    """
-    try:
-        if facts["kind"] == "PR":
-            pr = facts
-            pr_number = pr.get("number")
-            if not pr_number:
-                return
-
-            # Create embedding text from title and summary
-            title = pr.get("title", "")
-            summary = pr.get("summary", "")
-
-            if not title and not summary:
-                return
-
-            # Combine title and summary for embedding
-            embedding_text = f"{title}\n\n{summary}".strip()
-
-            # Generate embedding
-            embedding_vector = embed(embedding_text)
-            if not embedding_vector:
-                # Skip if embedding generation failed or is unavailable
-                return
-
-            # Find the PR node in the database to get its ID
-            with _conn() as c, c.cursor() as cur:
-                cur.execute(
-                    "SELECT id FROM codex_nodes WHERE ntype = 'PR' AND nkey = %s",
-                    (f"pr:{pr_number}",),
-                )
-                result = cur.fetchone()
 
-                if result:
-                    node_id = result["id"]
-                    # Store the embedding
-                    success = store_embedding(str(node_id), embedding_vector)
-                    if success:
-                        record_docs_generation("pr_embedding")
+    Returns:
+        Tuple of (ntype, nkey, metric_type, text), or None if there is nothing to embed
+    """
+    if facts["kind"] == "PR":
+        pr_number = facts.get("number")
+        # Create embedding text from title and summary
+        title = facts.get("title", "")
+        summary = facts.get("summary", "")
+        if not pr_number or (not title and not summary):
+            return None
+        return "PR", f"pr:{pr_number}", "pr_embedding", f"{title}\n\n{summary}".strip()
 
-        elif facts["kind"] == "Release":
-            rel = facts
-            tag = rel.get("tag")
-            if not tag:
-                return
+    if facts["kind"] == "Release":
+        tag = facts.get("tag")
+        # Use release notes for embedding
+        body = facts.get("body", "")
+        if not tag or not body:
+            return None
+        return "Release", f"release:{tag}", "release_embedding", f"Release {tag}\n\n{body}".strip()
 
-            # Create embedding text from tag and body
-            body = rel.get("body", "")
+    return None
 
-            if not body:
-                return
 
-            # Use release notes for embedding
-            embedding_text = f"Release {tag}\n\n{body}".strip()
+def _generate_embeddings(batch: list[dict[str, Any]]) -> None:
+    """
+    Generate and store embeddings for PR summaries and titles.
 
-            # Generate embedding
-            embedding_vector = embed(embedding_text)
-            if not embedding_vector:
-                return
+    All documents go to embed_batch at once, so their router requests are in
+    flight together; they are then stored EMBED_BATCH_SIZE per transaction.
 
-            # Find the Release node in the database
-            with _conn() as c, c.cursor() as cur:
+    Args:
+        batch: Facts dictionaries containing PR or Release information
+    """
+    try:
+        # One upsert cannot write the same node twice; the last document per node wins
+        docs = list({doc[:2]: doc for facts in batch if (doc := _embedding_doc(facts))}.values())
+        all_vectors = embed_batch([text for *_, text in docs])
+        for start in range(0, len(docs), EMBED_BATCH_SIZE):
+            chunk = docs[start : start + EMBED_BATCH_SIZE]
+            vectors = all_vectors[start : start + EMBED_BATCH_SIZE]
+            # Skip documents whose embedding failed or is unavailable
+            embedded = [
+                (doc, vector) for doc, vector in zip(chunk, vectors, strict=False) if vector.size
+            ]
+            if not embedded:
+                continue
+
+            with _conn() as c, c.transaction(), c.cursor() as cur:
+                # Binary COPY ships each vector as raw float16 rather than ~1536 float literals
                 cur.execute(
-                    "SELECT id FROM codex_nodes WHERE ntype = 'Release' AND nkey = %s",
-                    (f"release:{tag}",),
+                    "CREATE TEMP TABLE codex_embeddings_stage "
+                    "(ntype TEXT, nkey TEXT, model TEXT, text_hash TEXT, vector HALFVEC) "
+                    "ON COMMIT DROP"
                 )
-                result = cur.fetchone()
+                with cur.copy(
+                    "COPY codex_embeddings_stage (ntype, nkey, model, text_hash, vector) "
+                    "FROM STDIN (FORMAT BINARY)"
+                ) as cp:
+                    cp.set_types(["text", "text", "text", "text", "halfvec"])
+                    for (ntype, nkey, _, text), vector in embedded:
+                        cp.write_row(
+                            (
+                                ntype,
+                                nkey,
+                                DEFAULT_MODEL,
+                                text_hash(text),
+                                np.asarray(vector, dtype=np.float16),
+                            )
+                        )
+                cur.execute(_INSERT_STAGED_EMBEDDING_BLOBS_SQL)
+                cur.execute(_UPSERT_STAGED_EMBEDDINGS_SQL)
+                stored = cur.fetchall()
 
-                if result:
-                    node_id = result["id"]
-                    # Store the embedding
-                    success = store_embedding(str(node_id), embedding_vector)
-                    if success:
-                        record_docs_generation("release_embedding")
+            metric_types = {doc[:2]: doc[2] for doc, _ in embedded}
+            for ntype, nkey in stored:
+                record_docs_generation(metric_types[(ntype, nkey)])
 
     except Exception as e:
         # Log error but don't fail the entire render process
@@ -540,15 +705,41 @@ def _generate_embeddings(facts: dict[str, Any]) -> None:
         logger.error(f"Failed to generate embeddings: {e}")
 
 
-def _update_owners_doc():
+class _EmbeddingBatcher:
+    """Collects the facts of concurrent render_docs calls into one _generate_embeddings call."""
+
+    def __init__(self) -> None:
+        self.pending: list[dict[str, Any]] = []
+        self._flush: asyncio.Task | None = None
+
+    async def add(self, facts: dict[str, Any]) -> None:
+        """Queue facts and wait until the batch they joined has been stored."""
+        self.pending.append(facts)
+        if self._flush is None:
+            self._flush = asyncio.create_task(self._run())
+        # One render being cancelled must not cancel the batch the others are waiting on
+        await asyncio.shield(self._flush)
+
+    async def _run(self) -> None:
+        await asyncio.sleep(EMBED_LINGER_SECONDS)
+        # Renders arriving from here on start the next batch
+        batch, self.pending, self._flush = self.pending, [], None
+        # Embedding calls and storage are blocking; keep them off the event loop
+        await asyncio.to_thread(_generate_embeddings, batch)
+
+
+_embedding_batcher = _EmbeddingBatcher()
+
+
+async def _update_owners_doc():
     """Update the owners.md file with current ownership data from the graph."""
     # Only proceed if owners feature is enabled
-    if os.getenv("CODEX_OWNERS_ENABLED", "false").lower() != "true":
+    if not OWNERS_ENABLED:
         return
 
-    with _conn() as c, c.cursor() as cur:
+    async with _aconn() as c, c.cursor(row_factory=dict_row) as cur:
         # Query for owners and their file counts
-        cur.execute(
+        await cur.execute(
             """
             SELECT
                 o.title as owner_name,
@@ -565,57 +756,94 @@ def _update_owners_doc():
         """
         )
 
-        owners_data = cur.fetchall()
-
-        if not owners_data:
-            return  # No ownership data yet
-
-        # Generate the table content
-        table_rows = []
-        for owner in owners_data:
-            owner_name = owner["owner_name"]
-            owner_type = owner["owner_type"] or "unknown"
-            file_count = owner["file_count"]
-            last_activity = owner["last_activity"]
-
-            # Format last activity
-            if last_activity:
-                activity_str = last_activity.strftime("%Y-%m-%d")
-            else:
-                activity_str = "No recent activity"
-
-            # Format owner type
-            type_display = owner_type.title()
-
-            table_rows.append(f"| {owner_name} | {type_display} | {file_count} | {activity_str} |")
-
-        # Read current owners.md content
-        owners_file = DOCS_DIR / "owners.md"
-        if owners_file.exists():
-            content = owners_file.read_text()
-
-            # Find the table section and replace it
-            table_start = content.find("| Owner | Type | Files Owned | Recent Activity |")
-            if table_start != -1:
-                # Find the end of the table (next section or end of content)
-                table_end = content.find("\n\n*This table is automatically updated", table_start)
-                if table_end != -1:
-                    table_end = (
-                        content.find("*", table_end)
-                        + content[table_end:].find("\n")
-                        + table_end
-                        + 1
-                    )
-
-                    # Replace the table content
-                    new_table = "| Owner | Type | Files Owned | Recent Activity |\n"
-                    new_table += "|-------|------|-------------|----------------|\n"
-                    new_table += "\n".join(table_rows) + "\n\n"
-                    new_table += "*This table is automatically updated based on CODEOWNERS patterns and file changes in pull requests.*"
-
-                    updated_content = content[:table_start] + new_table + content[table_end:]
-                    owners_file.write_text(updated_content)
-                    record_docs_generation("owners_doc")
+        owners_data = await cur.fetchall()
+
+    if not owners_data:
+        return  # No ownership data yet
+
+    # Generate the table content
+    table_rows = []
+    for owner in owners_data:
+        owner_name = owner["owner_name"]
+        owner_type = owner["owner_type"] or "unknown"
+        file_count = owner["file_count"]
+        last_activity = owner["last_activity"]
+
+        # Format last activity
+        if last_activity:
+            activity_str = last_activity.strftime("%Y-%m-%d")
+        else:
+            activity_str = "No recent activity"
+
+        # Format owner type
+        type_display = owner_type.title()
+
+        table_rows.append(f"| {owner_name} | {type_display} | {file_count} | {activity_str} |")
+
+    # Read current owners.md content
+    owners_file = DOCS_DIR / "owners.md"
+    if owners_file.exists():
+        content = owners_file.read_text()
+
+        # Replace everything between the table markers
+        pre, start, rest = content.partition(OWNERS_TABLE_START)
+        _, end, post = rest.partition(OWNERS_TABLE_END)
+        if start and end:
+            new_table = "\n".join(
+                [
+                    "| Owner | Type | Files Owned | Recent Activity |",
+                    "|-------|------|-------------|----------------|",
+                    *table_rows,
+                ]
+            )
+            updated_content = (
+                f"{pre}{OWNERS_TABLE_START}\n\n{new_table}\n\n{OWNERS_TABLE_END}{post}"
+            )
+            # Unchanged ownership leaves the file (and its mtime) alone
+            if updated_content != content:
+                owners_file.write_text(updated_content)
+                record_docs_generation("owners_doc")
+
+
+# mkdocs.yml lives at the repo root
+PORTAL_CONFIG_FILE = REPO_ROOT / "mkdocs.yml"
+
+
+def _build_portal() -> None:
+    """Run one clean MkDocs build, in-process when mkdocs is importable here."""
+    try:
+        # Only the portal build needs mkdocs, so importing activities does not
+        from mkdocs.commands.build import build as mkdocs_build  # noqa: PLC0415
+        from mkdocs.config import load_config  # noqa: PLC0415
+    except ImportError:
+        subprocess.check_call(
+            [
+                "python",
+                "-m",
+                "mkdocs",
+                "build",
+                "--clean",
+                "--config-file",
+                str(PORTAL_CONFIG_FILE),
+                "--site-dir",
+                str(SITE_DIR),
+            ],
+            cwd=str(REPO_ROOT),
+        )
+        return
+
+    # A fresh config per build keeps nav current and plugin on_config state from piling up
+    cfg = load_config(str(PORTAL_CONFIG_FILE), site_dir=str(SITE_DIR))
+    cfg.plugins.on_startup(command="build", dirty=False)
+    try:
+        # Not dirty: a dirty build skips unchanged pages, leaving their nav stale, and never
+        # removes pages whose sources were deleted
+        mkdocs_build(cfg, dirty=False)
+    finally:
+        cfg.plugins.on_shutdown()
+
+
+_portal_lock = asyncio.Lock()
 
 
 @activity.defn
@@ -624,11 +852,9 @@ async def publish_portal(path: str) -> dict[str, str]:
     # Build MkDocs locally; CI can deploy to Pages or S3.
     site = SITE_DIR
     site.mkdir(parents=True, exist_ok=True)
-    # Find repo root (mkdocs.yml should live there)
-    repo_root = REPO_ROOT
-    subprocess.check_call(
-        ["python", "-m", "mkdocs", "build", "--clean", "--site-dir", str(site)], cwd=str(repo_root)
-    )
+    # Builds share one site dir, so run them one at a time
+    async with _portal_lock:
+        await asyncio.to_thread(_build_portal)
     record_docs_generation("portal_publish")
     return {"site_dir": str(site)}
 
@@ -639,15 +865,19 @@ async def cleanup_database() -> dict[str, Any]:
     """Periodic cleanup of old delivery records and temporary branch data."""
     try:
         # Clean up old delivery records (90 days)
-        _cleanup_old_deliveries(90)
+        await _cleanup_old_deliveries(90)
 
         # Clean up temporary branch edges (90 days)
-        _cleanup_temporary_branch_edges(90)
+        await _cleanup_temporary_branch_edges(90)
+
+        # Removing nodes can leave shared embedding vectors unreferenced
+        await _cleanup_orphan_embedding_blobs()
 
         return {
             "status": "success",
             "cleaned_deliveries": True,
             "cleaned_temp_branches": True,
+            "cleaned_embedding_blobs": True,
             "retention_days": 90,
         }
     except Exception as e:
@@ -1,40 +1,69 @@
 import os
+from typing import Annotated, Any
 
-import psycopg
-from fastapi import FastAPI
+import orjson
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from psycopg_pool import AsyncConnectionPool
+
+
+class _ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson instead of the stdlib encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
 
 app = FastAPI()
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["GET"], allow_headers=["*"])
 
 
-@app.get("/graph/pr/{number}")
-def pr_graph(number: int):
+@app.on_event("startup")
+async def startup_event():
+    """Open the shared connection pool once, instead of connecting per request."""
+    app.state.pool = AsyncConnectionPool(
+        os.getenv("DATABASE_URL", ""), min_size=1, max_size=8, open=False
+    )
+    await app.state.pool.open()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the shared connection pool."""
+    await app.state.pool.close()
+
+
+def get_pool(request: Request) -> AsyncConnectionPool:
+    """Dependency returning the pool opened at startup."""
+    return request.app.state.pool
+
+
+@app.get("/graph/pr/{number}", response_class=_ORJSONResponse)
+async def pr_graph(number: int, pool: Annotated[AsyncConnectionPool, Depends(get_pool)]):
     """Get graph data for a specific PR including connected nodes and edges."""
-    with psycopg.connect(os.getenv("DATABASE_URL")) as c, c.cursor() as cur:
-        # Find the PR node
-        cur.execute("SELECT id FROM codex_nodes WHERE ntype='PR' AND nkey=%s", (f"pr:{number}",))
-        row = cur.fetchone()
-        if not row:
-            return {"nodes": [], "edges": []}
-
-        pr_id = row[0]
-
-        # Start with the PR node
-        nodes = [{"ntype": "PR", "nkey": f"pr:{number}", "title": f"PR #{number}"}]
-
-        # Get all connected nodes and edges
-        cur.execute(
-            """SELECT n2.ntype, n2.nkey, n2.title, e.rel
-               FROM codex_edges e
-               JOIN codex_nodes n2 ON e.dst = n2.id
-               WHERE e.src = %s""",
-            (pr_id,),
+    pr_key = f"pr:{number}"
+    # Named (server-side) cursor streams large neighborhoods instead of buffering them
+    async with pool.connection() as c, c.cursor(name="pr_graph") as cur:
+        # Find the PR node and its connected nodes in one round-trip; the LEFT JOINs
+        # keep a single all-NULL row for a PR without edges
+        await cur.execute(
+            """WITH pr AS (SELECT id FROM codex_nodes WHERE ntype='PR' AND nkey=%s)
+               SELECT n2.ntype, n2.nkey, n2.title, e.rel
+               FROM pr
+               LEFT JOIN codex_edges e ON e.src = pr.id
+               LEFT JOIN codex_nodes n2 ON e.dst = n2.id""",
+            (pr_key,),
         )
+        rows = [row async for row in cur]
 
-        edges = []
-        for ntype, nkey, title, rel in cur.fetchall():
-            nodes.append({"ntype": ntype, "nkey": nkey, "title": title})
-            edges.append({"src": f"pr:{number}", "dst": nkey, "rel": rel})
+    if not rows:
+        return {"nodes": [], "edges": []}
 
-        return {"nodes": nodes, "edges": edges}
+    linked = [row for row in rows if row[1] is not None]
+    nodes = [
+        {"ntype": "PR", "nkey": pr_key, "title": f"PR #{number}"},
+        *({"ntype": ntype, "nkey": nkey, "title": title} for ntype, nkey, title, _ in linked),
+    ]
+    edges = [{"src": pr_key, "dst": nkey, "rel": rel} for _, nkey, _, rel in linked]
+    return {"nodes": nodes, "edges": edges}
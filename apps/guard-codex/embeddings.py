@@ -6,11 +6,23 @@ This module provides text embedding capabilities for GitGuard's knowledge graph,
 enabling semantic search over PR summaries, titles, and other textual content.
 """
 
+import asyncio
+import base64
+import collections
+import functools
+import hashlib
 import logging
 import os
+import threading
+
+import httpx
+import numpy as np
+import orjson
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 
     REQUESTS_AVAILABLE = True
 except ImportError:
@@ -18,165 +30,461 @@ except ImportError:
     requests = None
 
 # Constants for magic numbers
+HTTP_OK = 200
 EMBEDDING_DIMENSION = 1536
 SINGLE_REQUEST_TIMEOUT = 10
 BATCH_REQUEST_TIMEOUT = 30
+# A router that does not accept a connection within this many seconds is treated as down,
+# instead of holding the caller for the full request timeout
+ROUTER_CONNECT_TIMEOUT = 2
+# embed_batch groups texts of similar length into chunks of at most BATCH_CHUNK_SIZE
+# texts and BATCH_TOKEN_BUDGET estimated tokens, and posts up to MAX_BATCHES_IN_FLIGHT
+# of them to the router concurrently
+BATCH_CHUNK_SIZE = 256
+BATCH_TOKEN_BUDGET = 8192
+CHARS_PER_TOKEN = 4
+MAX_BATCHES_IN_FLIGHT = 8
 DEFAULT_SEARCH_LIMIT = 20
+# HNSW candidate list size per search; recall improves with size, up to a cost in latency
+HNSW_EF_SEARCH = 64
+# Candidates fetched from the quantized index per search before the exact rerank
+RERANK_CANDIDATES = 200
 DEFAULT_MODEL = "text-embedding-3-large"
+ROUTER_POOL_CONNECTIONS = 16
+ROUTER_POOL_MAXSIZE = 64
+ROUTER_RETRIES = 3
+ROUTER_RETRY_BACKOFF = 0.3
+# Recently embedded texts kept in memory; float32 rows are ~6 KB each
+EMBED_CACHE_SIZE = 4096
+
+# Read once at import; the router address is fixed for the life of a worker
+_ROUTER_URL = os.getenv("MODEL_ROUTER_URL")
+_EMBED_URL = f"{_ROUTER_URL}/embed" if _ROUTER_URL else None
+_BATCH_URL = f"{_ROUTER_URL}/embed/batch" if _ROUTER_URL else None
+_JSON_HEADERS = {"content-type": "application/json"}
+
+# Returned for failed or unavailable embeddings; read-only because it is shared
+_NO_EMBEDDING = np.empty(0, dtype=np.float32)
+_NO_EMBEDDING.flags.writeable = False
 
 logger = logging.getLogger(__name__)
 
-
-def embed(text: str) -> list[float]:
+# Content-hash LRU of successful embeddings, shared by embed() and embed_batch()
+_embed_cache: collections.OrderedDict[str, np.ndarray] = collections.OrderedDict()
+_embed_cache_lock = threading.Lock()
+
+
+def text_hash(text: str, model: str = DEFAULT_MODEL) -> str:
+    """Content address of an embedded text; identical texts share one cached and stored vector."""
+    return hashlib.blake2b(f"{model}\0{text}".encode(), digest_size=16).hexdigest()
+
+
+def embedding_key(
+    embedding: np.ndarray, text: str | None = None, model: str = DEFAULT_MODEL
+) -> str:
+    """Blob key for a stored embedding; falls back to hashing the vector when the text is unknown."""
+    if text is not None:
+        return text_hash(text, model)
+    digest = hashlib.blake2b(np.asarray(embedding, dtype=np.float16).tobytes(), digest_size=16)
+    return f"vector:{digest.hexdigest()}"
+
+
+def _cache_get(key: str) -> np.ndarray | None:
+    with _embed_cache_lock:
+        vector = _embed_cache.get(key)
+        if vector is not None:
+            _embed_cache.move_to_end(key)
+    return vector
+
+
+def _cache_put(key: str, embedding: np.ndarray) -> None:
+    # Failed (empty) embeddings are not cached, so the next call retries them
+    if not embedding.size:
+        return
+    # Cached arrays are handed to every caller of the same text, so freeze them
+    embedding.flags.writeable = False
+    with _embed_cache_lock:
+        _embed_cache[key] = embedding
+        _embed_cache.move_to_end(key)
+        if len(_embed_cache) > EMBED_CACHE_SIZE:
+            _embed_cache.popitem(last=False)
+
+
+def clear_embed_cache() -> None:
+    """Drop every cached embedding."""
+    with _embed_cache_lock:
+        _embed_cache.clear()
+
+
+@functools.cache
+def _session() -> "requests.Session":
+    """Keep-alive session shared by embed() calls, so each one skips the TCP/TLS handshake."""
+    session = requests.Session()
+    # Embedding requests are idempotent, so transient router errors are safe to retry.
+    # A refused or timed-out connect means the router is down; fail fast instead of backing off
+    retry = Retry(
+        total=ROUTER_RETRIES,
+        connect=0,
+        backoff_factor=ROUTER_RETRY_BACKOFF,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["POST"],
+    )
+    adapter = HTTPAdapter(
+        pool_connections=ROUTER_POOL_CONNECTIONS,
+        pool_maxsize=ROUTER_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def embed(text: str) -> np.ndarray:
     """
     Generate embeddings for the given text using the model router.
 
     This function hooks into your model router to generate 1536-dimensional
     embeddings for semantic search. If the embedding service is unavailable
-    or fails, returns an empty list to gracefully skip embedding storage.
+    or fails, returns an empty array to gracefully skip embedding storage.
+
+    Repeated texts (retries, rebuilds, replayed events) are answered from an
+    in-memory cache keyed by a hash of the text.
 
     Args:
         text: The text to embed (PR summary, title, etc.)
 
     Returns:
-        List of 1536 floats representing the text embedding,
-        or empty list if embedding fails or is unavailable
+        Read-only float32 array of 1536 values representing the text embedding,
+        or an empty array if embedding fails or is unavailable
     """
     if not text or not text.strip():
-        return []
+        return _NO_EMBEDDING
+
+    key = text_hash(text)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    embedding = _request_embedding(text)
+    _cache_put(key, embedding)
+    return embedding
 
+
+def _to_vector(value: str | list[float]) -> np.ndarray:
+    """Router embedding as float32; base64-packed float32 bytes decode without boxing floats."""
+    if isinstance(value, str):
+        return np.frombuffer(base64.b64decode(value), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _request_embedding(text: str) -> np.ndarray:
+    """Ask the model router for one embedding; empty array on any failure."""
     if not REQUESTS_AVAILABLE:
         logger.warning("Requests module not available, embedding generation disabled")
-        return []
+        return _NO_EMBEDDING
 
     try:
         # Hook to your model router here
         # This is a placeholder implementation that you should replace
         # with your actual model router endpoint
 
-        router_url = os.getenv("MODEL_ROUTER_URL")
-        if not router_url:
+        if not _EMBED_URL:
             logger.debug("MODEL_ROUTER_URL not configured, skipping embeddings")
-            return []
+            return _NO_EMBEDDING
 
         # Example API call to model router
         # Replace this with your actual router interface
-        response = requests.post(
-            f"{router_url}/embed",
-            json={
-                "text": text,
-                "model": DEFAULT_MODEL,  # or your preferred model
-                "dimensions": EMBEDDING_DIMENSION,
-            },
-            timeout=SINGLE_REQUEST_TIMEOUT,
+        response = _session().post(
+            _EMBED_URL,
+            data=orjson.dumps(
+                {
+                    "text": text,
+                    "model": DEFAULT_MODEL,  # or your preferred model
+                    "dimensions": EMBEDDING_DIMENSION,
+                }
+            ),
+            headers=_JSON_HEADERS,
+            timeout=(ROUTER_CONNECT_TIMEOUT, SINGLE_REQUEST_TIMEOUT),
         )
 
-        if response.status_code == 200:
-            data = response.json()
-            embedding = data.get("embedding", [])
+        if response.status_code == HTTP_OK:
+            data = orjson.loads(response.content)
+            # Routers that can send raw float32 bytes as base64 skip float parsing entirely
+            embedding = _to_vector(data.get("embedding_b64", data.get("embedding", [])))
 
             # Validate embedding dimensions
-            if len(embedding) == EMBEDDING_DIMENSION:
+            if embedding.shape == (EMBEDDING_DIMENSION,):
                 return embedding
             else:
                 logger.warning(
                     f"Unexpected embedding dimension: {len(embedding)}, expected {EMBEDDING_DIMENSION}"
                 )
-                return []
+                return _NO_EMBEDDING
         else:
             logger.warning(f"Embedding API returned status {response.status_code}")
-            return []
+            return _NO_EMBEDDING
 
     except Exception as e:
         logger.error(f"Embedding request failed: {e}")
+        return _NO_EMBEDDING
+
+
+async def _post_single(client: httpx.AsyncClient, sem: asyncio.Semaphore, text: str) -> np.ndarray:
+    """Embed one text through the single-text endpoint; empty array on any failure."""
+    try:
+        async with sem:
+            response = await client.post(
+                _EMBED_URL,
+                content=orjson.dumps(
+                    {"text": text, "model": DEFAULT_MODEL, "dimensions": EMBEDDING_DIMENSION}
+                ),
+                headers=_JSON_HEADERS,
+            )
+
+        if response.status_code != HTTP_OK:
+            logger.warning(f"Embedding API returned status {response.status_code}")
+            return _NO_EMBEDDING
+
+        data = orjson.loads(response.content)
+        embedding = _to_vector(data.get("embedding_b64", data.get("embedding", [])))
+        if embedding.shape == (EMBEDDING_DIMENSION,):
+            return embedding
+        logger.warning(f"Unexpected embedding dimension: {len(embedding)}")
+        return _NO_EMBEDDING
+
+    except Exception as e:
+        logger.error(f"Embedding request failed: {e}")
+        return _NO_EMBEDDING
+
+
+async def _post_batch(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, texts: list[str]
+) -> list[np.ndarray]:
+    """Embed one chunk of texts; a failed chunk yields empty embeddings for just that chunk."""
+    try:
+        async with sem:
+            response = await client.post(
+                _BATCH_URL,
+                content=orjson.dumps(
+                    {"texts": texts, "model": DEFAULT_MODEL, "dimensions": EMBEDDING_DIMENSION}
+                ),
+                headers=_JSON_HEADERS,
+            )
+
+        if response.status_code != HTTP_OK:
+            logger.warning(f"Batch embedding API returned status {response.status_code}")
+            return await _post_each(client, sem, texts)
+
+        data = orjson.loads(response.content)
+        embeddings = data.get("embeddings_b64", data.get("embeddings", []))
+        # Results are spliced back by position, so a short answer cannot be trusted
+        if len(embeddings) != len(texts):
+            logger.warning(f"Batch embedding API returned {len(embeddings)} of {len(texts)}")
+            return await _post_each(client, sem, texts)
+
+        # Validate and return embeddings
+        result = []
+        for embedding_idx, embedding in enumerate(map(_to_vector, embeddings)):
+            if embedding.shape == (EMBEDDING_DIMENSION,):
+                result.append(embedding)
+            else:
+                logger.warning(
+                    f"Invalid embedding dimension for text {embedding_idx}: {len(embedding)}"
+                )
+                result.append(_NO_EMBEDDING)
+
+        return result
+
+    except Exception as e:
+        # Transport errors mean the router is unreachable, so per-text requests would fail too
+        logger.error(f"Batch embedding failed: {e}")
+        return [_NO_EMBEDDING for _ in texts]
+
+
+async def _post_each(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, texts: list[str]
+) -> list[np.ndarray]:
+    """Fall back to one request per text after the router rejected their batch."""
+    # One unembeddable text (e.g. over the model's context) fails the whole batch request;
+    # alone, only that text comes back empty
+    return list(await asyncio.gather(*(_post_single(client, sem, text) for text in texts)))
+
+
+def _length_buckets(texts: list[str], indices: list[int]) -> list[list[int]]:
+    """Group indices of texts into request chunks, shortest texts first."""
+    # A router pads every text in a request to the longest one, so similar
+    # lengths share a request and a long outlier cannot slow down short texts
+    buckets: list[list[int]] = [[]]
+    tokens = 0
+    for idx in sorted(indices, key=lambda idx: len(texts[idx])):
+        cost = len(texts[idx]) // CHARS_PER_TOKEN + 1
+        bucket = buckets[-1]
+        if bucket and (len(bucket) == BATCH_CHUNK_SIZE or tokens + cost > BATCH_TOKEN_BUDGET):
+            bucket = []
+            buckets.append(bucket)
+            tokens = 0
+        bucket.append(idx)
+        tokens += cost
+    return buckets
+
+
+async def aembed_batch(texts: list[str]) -> list[np.ndarray]:
+    """
+    Generate embeddings for multiple texts, posting chunks to the router concurrently.
+
+    Args:
+        texts: List of texts to embed
+
+    Returns:
+        List of float32 embeddings, same order as input texts.
+        Failed embeddings are returned as empty arrays.
+    """
+    if not texts:
         return []
 
+    keys = [text_hash(text) for text in texts]
+    result = [_cache_get(key) for key in keys]
+    # Only cache misses go to the router
+    misses = [idx for idx, embedding in enumerate(result) if embedding is None]
+    if not misses:
+        return result
+
+    if not _BATCH_URL:
+        logger.debug("MODEL_ROUTER_URL not configured, skipping batch embeddings")
+        return [_NO_EMBEDDING if embedding is None else embedding for embedding in result]
+
+    buckets = _length_buckets(texts, misses)
+    sem = asyncio.Semaphore(MAX_BATCHES_IN_FLIGHT)
+    timeout = httpx.Timeout(BATCH_REQUEST_TIMEOUT, connect=ROUTER_CONNECT_TIMEOUT)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        chunks = await asyncio.gather(
+            *(_post_batch(client, sem, [texts[idx] for idx in bucket]) for bucket in buckets)
+        )
 
-def embed_batch(texts: list[str]) -> list[list[float]]:
+    # Scatter each chunk's embeddings back to the input positions of its texts
+    for bucket, chunk in zip(buckets, chunks, strict=True):
+        for idx, embedding in zip(bucket, chunk, strict=True):
+            _cache_put(keys[idx], embedding)
+            result[idx] = embedding
+    return result
+
+
+def embed_batch(texts: list[str]) -> list[np.ndarray]:
     """
     Generate embeddings for multiple texts in batch.
 
+    Synchronous wrapper around aembed_batch; call it from a thread without a
+    running event loop (activities use asyncio.to_thread).
+
     Args:
         texts: List of texts to embed
 
     Returns:
-        List of embeddings, same order as input texts.
-        Failed embeddings are returned as empty lists.
+        List of float32 embeddings, same order as input texts.
+        Failed embeddings are returned as empty arrays.
     """
     if not texts:
         return []
 
-    if not REQUESTS_AVAILABLE:
-        logger.warning("Requests module not available, batch embedding generation disabled")
-        return [[] for _ in texts]
+    return asyncio.run(aembed_batch(texts))
 
-    try:
-        router_url = os.getenv("MODEL_ROUTER_URL")
-        if not router_url:
-            logger.debug("MODEL_ROUTER_URL not configured, skipping batch embeddings")
-            return [[] for _ in texts]
-
-        # Batch API call to model router
-        response = requests.post(
-            f"{router_url}/embed/batch",
-            json={"texts": texts, "model": DEFAULT_MODEL, "dimensions": EMBEDDING_DIMENSION},
-            timeout=BATCH_REQUEST_TIMEOUT,
-        )
 
-        if response.status_code == 200:
-            data = response.json()
-            embeddings = data.get("embeddings", [])
-
-            # Validate and return embeddings
-            result = []
-            for embedding_idx, embedding in enumerate(embeddings):
-                if len(embedding) == EMBEDDING_DIMENSION:
-                    result.append(embedding)
-                else:
-                    logger.warning(
-                        f"Invalid embedding dimension for text {embedding_idx}: {len(embedding)}"
-                    )
-                    result.append([])
-
-            return result
-        else:
-            logger.warning(f"Batch embedding API returned status {response.status_code}")
-            return [[] for _ in texts]
+# Statements run on every store/search; they are executed with prepare=True, so each
+# pooled connection parses and plans them once and reuses the plan afterwards
+_INSERT_BLOB_SQL = """
+    INSERT INTO codex_embedding_blobs (text_hash, vector)
+    VALUES (%s, %s)
+    ON CONFLICT (text_hash) DO NOTHING
+"""
 
-    except Exception as e:
-        logger.error(f"Batch embedding failed: {e}")
-        return [[] for _ in texts]
+_UPSERT_EMBEDDING_SQL = """
+    INSERT INTO codex_embeddings (node_id, model, text_hash)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (node_id) DO UPDATE SET
+        model = EXCLUDED.model,
+        text_hash = EXCLUDED.text_hash
+"""
+
+# Backfill rows are COPY'd into a temp stage, then upserted by two set-based statements
+_BULK_STAGE_SQL = (
+    "CREATE TEMP TABLE codex_embeddings_bulk_stage "
+    "(node_id TEXT, text_hash TEXT, vector HALFVEC) ON COMMIT DROP"
+)
+
+_BULK_INSERT_BLOBS_SQL = """
+    INSERT INTO codex_embedding_blobs (text_hash, vector)
+    SELECT text_hash, vector FROM codex_embeddings_bulk_stage
+    ON CONFLICT (text_hash) DO NOTHING
+"""
+
+_BULK_UPSERT_EMBEDDINGS_SQL = """
+    INSERT INTO codex_embeddings (node_id, model, text_hash)
+    SELECT node_id::uuid, %s, text_hash FROM codex_embeddings_bulk_stage
+    ON CONFLICT (node_id) DO UPDATE SET
+        model = EXCLUDED.model,
+        text_hash = EXCLUDED.text_hash
+"""
+
+_SET_EF_SEARCH_SQL = "SELECT set_config('hnsw.ef_search', %s, true)"
+
+# Candidates come from the binary-quantized index by Hamming distance, then only
+# those are ranked by exact cosine distance
+_SEARCH_SQL = """
+    WITH cand AS (
+        SELECT text_hash, vector
+        FROM codex_embedding_blobs
+        ORDER BY binary_quantize(vector)::bit(1536)
+            <~> binary_quantize(%(query)s::halfvec)
+        LIMIT %(candidates)s
+    )
+    SELECT
+        n.ntype,
+        n.nkey,
+        n.title,
+        n.data,
+        cand.vector <=> %(query)s::halfvec AS distance
+    FROM cand
+    JOIN codex_embeddings e ON e.text_hash = cand.text_hash
+    JOIN codex_nodes n ON n.id = e.node_id
+    ORDER BY distance
+    LIMIT %(limit)s
+"""
+
+
+def _conn():
+    """Borrow a pooled connection from the worker's activities module."""
+    # activities imports this module at load time, so it can only be imported once needed
+    from activities import _conn as activities_conn  # noqa: PLC0415
 
+    return activities_conn()
 
-def store_embedding(node_id: str, embedding: list[float], model: str = DEFAULT_MODEL) -> bool:
+
+def store_embedding(
+    node_id: str, embedding: np.ndarray, model: str = DEFAULT_MODEL, text: str | None = None
+) -> bool:
     """
     Store embedding in the database.
 
+    The vector is stored once per distinct text in codex_embedding_blobs and
+    the node references it by hash, so nodes with identical text share a row.
+
     Args:
         node_id: UUID of the node to associate with the embedding
         embedding: The embedding vector with expected dimensions
         model: Name of the embedding model used
+        text: The embedded text, used as the blob's content address
 
     Returns:
         True if stored successfully, False otherwise
     """
-    if not embedding or len(embedding) != EMBEDDING_DIMENSION:
+    if not node_id or embedding is None or len(embedding) != EMBEDDING_DIMENSION:
         return False
 
     try:
-        from .activities import _conn
-
-        with _conn() as c, c.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO codex_embeddings (node_id, model, vector)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (node_id) DO UPDATE SET
-                    model = EXCLUDED.model,
-                    vector = EXCLUDED.vector
-                """,
-                (node_id, model, embedding),
-            )
+        key = embedding_key(embedding, text, model)
+        with _conn() as c, c.transaction(), c.cursor() as cur:
+            cur.execute(_INSERT_BLOB_SQL, (key, embedding), prepare=True)
+            cur.execute(_UPSERT_EMBEDDING_SQL, (node_id, model, key), prepare=True)
             return True
 
     except Exception as e:
@@ -184,6 +492,51 @@ def store_embedding(node_id: str, embedding: list[float], model: str = DEFAULT_M
         return False
 
 
+def store_embeddings_bulk(
+    items: list[tuple[str, str | None, np.ndarray]], model: str = DEFAULT_MODEL
+) -> int:
+    """
+    Store many embeddings in one transaction, for backfills.
+
+    Rows are streamed to a staging table with a binary COPY and then upserted
+    by two statements, instead of one round-trip per embedding.
+
+    Args:
+        items: (node_id, text, embedding) tuples; text may be None if unknown
+        model: Name of the embedding model used
+
+    Returns:
+        Number of embeddings stored, 0 if the write failed
+    """
+    rows = {
+        node_id: (node_id, embedding_key(embedding, text, model), embedding)
+        for node_id, text, embedding in items
+        if node_id and embedding is not None and len(embedding) == EMBEDDING_DIMENSION
+    }
+    if len(rows) < len(items):
+        logger.warning(f"Skipping {len(items) - len(rows)} invalid or repeated embeddings")
+    if not rows:
+        return 0
+
+    try:
+        with _conn() as c, c.transaction(), c.cursor() as cur:
+            cur.execute(_BULK_STAGE_SQL)
+            with cur.copy(
+                "COPY codex_embeddings_bulk_stage (node_id, text_hash, vector) "
+                "FROM STDIN (FORMAT BINARY)"
+            ) as cp:
+                cp.set_types(["text", "text", "halfvec"])
+                for node_id, key, embedding in rows.values():
+                    cp.write_row((node_id, key, np.asarray(embedding, dtype=np.float16)))
+            cur.execute(_BULK_INSERT_BLOBS_SQL)
+            cur.execute(_BULK_UPSERT_EMBEDDINGS_SQL, (model,))
+            return len(rows)
+
+    except Exception as e:
+        logger.error(f"Failed to bulk store {len(rows)} embeddings: {e}")
+        return 0
+
+
 def search_similar(query_text: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
     """
     Search for similar content using semantic similarity.
@@ -196,39 +549,31 @@ def search_similar(query_text: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[d
         List of dictionaries containing node information and similarity scores
     """
     query_embedding = embed(query_text)
-    if not query_embedding:
+    if not query_embedding.size:
         logger.warning("Could not generate embedding for query, falling back to empty results")
         return []
 
     try:
-        from .activities import _conn
-
-        with _conn() as c, c.cursor() as cur:
+        with _conn() as c, c.transaction(), c.cursor() as cur:
+            candidates = max(RERANK_CANDIDATES, limit)
+            # Scoped to this transaction; HNSW returns at most ef_search rows, so cover them
+            cur.execute(_SET_EF_SEARCH_SQL, (str(max(HNSW_EF_SEARCH, candidates)),), prepare=True)
+            # The float32 array binds as one binary vector parameter (register_vector on the pool)
             cur.execute(
-                """
-                SELECT
-                    n.ntype,
-                    n.nkey,
-                    n.title,
-                    n.data,
-                    1 - (e.vector <=> %s) AS score
-                FROM codex_nodes n
-                JOIN codex_embeddings e ON e.node_id = n.id
-                ORDER BY e.vector <=> %s
-                LIMIT %s
-                """,
-                (query_embedding, query_embedding, limit),
+                _SEARCH_SQL,
+                {"query": query_embedding, "candidates": candidates, "limit": limit},
+                prepare=True,
             )
 
             results = []
-            for row in cur.fetchall():
+            for ntype, nkey, title, data, distance in cur.fetchall():
                 results.append(
                     {
-                        "type": row["ntype"],
-                        "key": row["nkey"],
-                        "title": row["title"],
-                        "data": row["data"],
-                        "score": float(row["score"]),
+                        "type": ntype,
+                        "key": nkey,
+                        "title": title,
+                        "data": data,
+                        "score": 1 - float(distance),
                     }
                 )
 
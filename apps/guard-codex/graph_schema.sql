@@ -24,13 +24,37 @@ CREATE TABLE IF NOT EXISTS codex_edges (
   PRIMARY KEY (src, dst, rel)
 );
 
--- Embeddings (optional)
+-- Embeddings (optional), stored once per distinct text and shared by every node embedding it
+CREATE TABLE IF NOT EXISTS codex_embedding_blobs (
+  text_hash TEXT PRIMARY KEY,       -- blake2b of model + embedded text
+  vector HALFVEC(1536) NOT NULL     -- adjust to your embedder; half precision halves table and index size
+);
+
 CREATE TABLE IF NOT EXISTS codex_embeddings (
   node_id UUID PRIMARY KEY REFERENCES codex_nodes(id) ON DELETE CASCADE,
   model TEXT NOT NULL DEFAULT 'text-embedding-3-large',
-  vector VECTOR(1536)               -- adjust to your embedder
+  text_hash TEXT NOT NULL REFERENCES codex_embedding_blobs(text_hash)
 );
 
+-- Move vectors stored per node into blobs; their texts are unknown, so they are keyed by the vector
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'codex_embeddings' AND column_name = 'vector'
+  ) THEN
+    INSERT INTO codex_embedding_blobs (text_hash, vector)
+    SELECT 'legacy:' || md5(vector::text), vector::HALFVEC(1536)
+    FROM codex_embeddings WHERE vector IS NOT NULL
+    ON CONFLICT (text_hash) DO NOTHING;
+    ALTER TABLE codex_embeddings
+      ADD COLUMN text_hash TEXT REFERENCES codex_embedding_blobs(text_hash);
+    UPDATE codex_embeddings SET text_hash = 'legacy:' || md5(vector::text);
+    DELETE FROM codex_embeddings WHERE text_hash IS NULL;
+    ALTER TABLE codex_embeddings DROP COLUMN vector, ALTER COLUMN text_hash SET NOT NULL;
+  END IF;
+END $$;
+
 -- Delivery deduplication table
 CREATE TABLE IF NOT EXISTS codex_seen_deliveries (
   delivery_id TEXT PRIMARY KEY,
@@ -41,3 +65,11 @@ CREATE INDEX IF NOT EXISTS idx_codex_nodes_type ON codex_nodes(ntype);
 CREATE INDEX IF NOT EXISTS idx_codex_nodes_key  ON codex_nodes(nkey);
 CREATE INDEX IF NOT EXISTS idx_codex_edges_rel  ON codex_edges(rel);
 CREATE INDEX IF NOT EXISTS idx_codex_seen_deliveries_received_at ON codex_seen_deliveries(received_at);
+-- Without an ANN index every similarity search is a sequential scan over all embeddings.
+-- The index holds 1-bit quantized vectors (192 bytes each) to find candidates, which
+-- search_similar then reranks by exact halfvec cosine distance
+DROP INDEX IF EXISTS idx_codex_embedding_blobs_vector_hnsw;
+CREATE INDEX IF NOT EXISTS idx_codex_embedding_blobs_vector_bq_hnsw ON codex_embedding_blobs
+  USING hnsw ((binary_quantize(vector)::bit(1536)) bit_hamming_ops)
+  WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS idx_codex_embeddings_text_hash ON codex_embeddings(text_hash);
@@ -3,7 +3,7 @@ import pathlib
 import subprocess
 import time
 
-from embeddings import embed, search_similar
+from embeddings import search_similar
 from fastapi import FastAPI, Query
 from pydantic import BaseModel
 
@@ -97,13 +97,8 @@ def semantic_search(q: str = Query(..., description="Search query")):
     Returns nodes ranked by semantic similarity to the query.
     """
     try:
-        # Generate embedding for the query
-        query_vector = embed(q)
-        if not query_vector:
-            return {"status": "error", "message": "Embedding generation unavailable"}
-
-        # Search for similar content
-        results = search_similar(query_vector, limit=20)
+        # search_similar embeds the query itself
+        results = search_similar(q, limit=20)
 
         return {"status": "ok", "query": q, "results": results, "count": len(results)}
     except Exception as e:
@@ -135,21 +135,29 @@ class MetricsActivityDecorator:
     def __init__(self, activity_func):
         self.activity_func = activity_func
         self.activity_name = activity_func.__name__
+        # Label children are bound once here rather than looked up on every call
+        name = self.activity_name
+        self._active = active_activities.labels(activity_name=name)
+        self._succeeded = activity_executions_total.labels(activity_name=name, status="success")
+        self._failed = activity_executions_total.labels(activity_name=name, status="failure")
+        self._duration = activity_duration_seconds.labels(activity_name=name)
 
     async def __call__(self, *args, **kwargs):
-        start_time = time.time()
-        record_activity_start(self.activity_name)
+        start_time = time.perf_counter()
+        self._active.inc()
 
         try:
             result = await self.activity_func(*args, **kwargs)
-            duration = time.time() - start_time
-            record_activity_completion(self.activity_name, duration, success=True)
-            return result
         except Exception as e:
-            duration = time.time() - start_time
-            record_activity_completion(self.activity_name, duration, success=False)
+            self._failed.inc()
             record_activity_failure(self.activity_name, type(e).__name__)
             raise
+        else:
+            self._succeeded.inc()
+            return result
+        finally:
+            self._duration.observe(time.perf_counter() - start_time)
+            self._active.dec()
 
 
 def metrics_activity(func):
@@ -1,14 +1,58 @@
 import asyncio
-import json
+import hashlib
 import os
 
+import orjson
 from nats.aio.client import Client as NATS
+from nats.errors import TimeoutError as FetchTimeout
 from temporalio.client import Client as Temporal
+from temporalio.exceptions import WorkflowAlreadyStartedError
 
 NATS_URL = os.getenv("NATS_URL", "nats://nats:4222")
 SUBJECTS = ["gh.pull_request.*", "gh.release.*"]  # extend as needed
 STREAM_NAME = "GH"
 CONSUMER_NAME = "CODEX"
+# Messages pulled per fetch, and how long a fetch waits to fill the batch (seconds)
+FETCH_BATCH = 64
+FETCH_TIMEOUT = 0.5
+# Workers starting workflows concurrently, and fetched messages waiting for a free worker
+START_WORKERS = 16
+QUEUE_SIZE = 2 * FETCH_BATCH
+
+
+def _parse_event(data: bytes) -> dict | None:
+    """Parse an event payload; None unless it is a JSON object."""
+    # orjson holds the GIL while parsing, so a thread pool would only move the work elsewhere
+    try:
+        evt = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return None
+    return evt if isinstance(evt, dict) else None
+
+
+async def _pull(psub, queue: asyncio.Queue):
+    """Feed fetched messages to the workers."""
+    while True:
+        try:
+            msgs = await psub.fetch(FETCH_BATCH, timeout=FETCH_TIMEOUT)
+        except FetchTimeout:
+            continue
+        # Blocks while the queue is full, so a burst waits in JetStream instead of memory
+        for msg in msgs:
+            await queue.put(msg)
+
+
+async def _worker(queue: asyncio.Queue, handler):
+    """Handle queued messages one at a time; each message acks or naks itself."""
+    while True:
+        msg = await queue.get()
+        try:
+            await handler(msg)
+        except Exception as e:
+            # An unacked message is redelivered after ack_wait
+            print(f"[codex] Failed to handle message: {e}")
+        finally:
+            queue.task_done()
 
 
 async def main():
@@ -21,48 +65,47 @@ async def main():
     )
 
     async def handler(msg):
-        try:
-            evt = json.loads(msg.data.decode())
-        except Exception:
+        evt = _parse_event(msg.data)
+        if evt is None:
+            # Malformed JSON, or JSON that is not an event object such as [] or "x"
             await msg.nak()
             return
 
-        # Event deduplication using delivery_id for workflow idempotency
-        wf_id = f"codex-{evt.get('delivery_id') or evt.get('pull_request',{}).get('id') or hash(json.dumps(evt,sort_keys=True))}"
+        # Event deduplication using delivery_id for workflow idempotency; redeliveries carry
+        # the same payload bytes, so the fallback hashes them as received
+        wf_id = f"codex-{evt.get('delivery_id') or evt.get('pull_request',{}).get('id') or hashlib.blake2b(msg.data, digest_size=8).hexdigest()}"
 
         try:
-            handle = t.create_workflow_handle(
-                "CodexWorkflow", id=wf_id, task_queue="codex-task-queue"
-            )
-            await handle.start(evt)
+            await t.start_workflow("CodexWorkflow", evt, id=wf_id, task_queue="codex-task-queue")
             print(f"[codex] Started workflow {wf_id} for event {evt.get('event', 'unknown')}")
             await msg.ack()
+        except WorkflowAlreadyStartedError:
+            # Workflow already exists (idempotency)
+            print(f"[codex] Workflow {wf_id} already exists - skipping duplicate event")
+            await msg.ack()  # Acknowledge duplicate to prevent redelivery
         except Exception as e:
-            # Workflow already exists (idempotency) or other error
-            if (
-                "already exists" in str(e).lower()
-                or "workflow execution already started" in str(e).lower()
-            ):
-                print(f"[codex] Workflow {wf_id} already exists - skipping duplicate event")
-                await msg.ack()  # Acknowledge duplicate to prevent redelivery
-            else:
-                print(f"[codex] Failed to start workflow {wf_id}: {e}")
-                await msg.nak()  # Negative acknowledge for retry
-
-    # Subscribe to durable consumer
+            print(f"[codex] Failed to start workflow {wf_id}: {e}")
+            await msg.nak()  # Negative acknowledge for retry
+
+    # Pull from the durable consumer in batches instead of one callback per message
     try:
-        await js.subscribe(
-            "gh.*.*", cb=handler, stream=STREAM_NAME, durable=CONSUMER_NAME, manual_ack=True
-        )
+        psub = await js.pull_subscribe("gh.*.*", durable=CONSUMER_NAME, stream=STREAM_NAME)
         print(f"[codex] Listening on JetStream consumer {CONSUMER_NAME} for stream {STREAM_NAME}")
     except Exception as e:
         print(f"[codex] Failed to subscribe to JetStream consumer: {e}")
-        print("[codex] Make sure to run 'make nats.setup' to create the stream and consumer")
+        print(
+            "[codex] Run 'make nats.setup' to create the stream and the CODEX pull consumer;"
+            " it also replaces a CODEX consumer left in push mode"
+        )
         raise
 
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
     try:
-        while True:
-            await asyncio.sleep(3600)
+        # One slow workflow start no longer holds up the rest of its fetched batch
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(START_WORKERS):
+                tg.create_task(_worker(queue, handler))
+            tg.create_task(_pull(psub, queue))
     except KeyboardInterrupt:
         pass
     finally:
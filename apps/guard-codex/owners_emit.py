@@ -25,18 +25,20 @@ def emit_owners_index(db_url: str, docs_dir: str = "docs"):
       join codex_nodes n_pr on n_pr.id = e2.src and n_pr.ntype='PR'
       group by 1
     )
-    select t.owner, t.files, coalesce(recent.last_seen,'—') last_seen
-    from t left join recent using(owner)
-    order by t.files desc, t.owner;
+    -- The table body is rendered server-side and fetched as one TEXT value
+    select string_agg(
+      format('| `%s` | %s | %s |', t.owner, t.files, coalesce(recent.last_seen,'—')),
+      E'\\n' order by t.files desc, t.owner
+    )
+    from t left join recent using(owner);
     """
 
     with psycopg.connect(db_url) as c, c.cursor() as cur:
         cur.execute(q)
-        rows = cur.fetchall()
+        (table,) = cur.fetchone()
 
     md = ["# People & Ownership\n", "| Owner | Files | Recent Activity |", "|---|---:|:---|"]
-
-    for o, f, ls in rows:
-        md.append(f"| `{o}` | {f} | {ls} |")
+    if table:
+        md.append(table)
 
     pathlib.Path(docs_dir, "owners.md").write_text("\n".join(md), encoding="utf-8")
@@ -1,10 +1,17 @@
-from pathlib import Path
+import fnmatch
+import functools
+import re
+from pathlib import PurePosixPath
 
 # Constants for magic numbers
 MIN_CODEOWNERS_PARTS = 2
 PATTERN_INDEX = 0
 OWNERS_START_INDEX = 1
 AT_PREFIX_INDEX = 1
+# Distinct owner handles remembered by normalize_owner_handle and get_owner_type
+OWNER_HANDLE_CACHE_SIZE = 4096
+# Characters that make a pattern component a glob rather than a literal name
+GLOB_CHARS = frozenset("*?[")
 
 
 def parse_codeowners(text: str) -> list[tuple[str, list[str]]]:
@@ -41,26 +48,162 @@ def owner_for(path: str, rules: list[tuple[str, list[str]]]) -> tuple[str, list[
     Returns:
         Tuple of (pattern, owners) for the best match, or None if no match
     """
+    pure = PurePosixPath(path)
+    parts = pure.parts
     best = None
     for pattern, handles in rules:
-        # Convert CODEOWNERS pattern to pathlib-compatible pattern
-        # Replace ** with * for pathlib matching
-        pathlib_pattern = pattern.replace("**", "*")
-
-        try:
-            if Path(path).match(pathlib_pattern):
-                best = (pattern, handles)
-        except ValueError:
+        compiled = _compile_pattern(pattern)
+        if compiled is None:
             # Handle invalid patterns gracefully
             continue
+        components, root, literal = compiled
+        size = len(components)
+        if root:
+            if pure.root != root or len(parts) != size + 1:
+                continue
+        elif size > len(parts):
+            continue
+        if literal:
+            # Most CODEOWNERS rules are plain paths: one tuple comparison, no regex
+            matched = parts[len(parts) - size :] == components
+        else:
+            matched = all(
+                regex.match(part)
+                for regex, part in zip(reversed(components), reversed(parts), strict=False)
+            )
+        if matched:
+            best = (pattern, handles)
 
     return best
 
 
+@functools.lru_cache(maxsize=1024)
+def _compile_pattern(
+    pattern: str,
+) -> tuple[tuple[str, ...] | tuple[re.Pattern[str], ...], str, bool] | None:
+    """
+    Compile a CODEOWNERS pattern once into one regex per path component.
+
+    Patterns without glob characters keep their components as strings, to be
+    compared directly instead of through regexes.
+
+    Matches like Path.match with "**" treated as "*": a relative pattern matches
+    the trailing components of a path, an anchored one all of a path with the same root.
+
+    Args:
+        pattern: CODEOWNERS pattern
+
+    Returns:
+        Tuple of (components, root, literal), root being "" for a relative
+        pattern, or None for an empty pattern
+    """
+    pure = PurePosixPath(pattern.replace("**", "*"))
+    if not pure.parts:
+        return None
+    parts = pure.parts[1:] if pure.root else pure.parts
+    if all(GLOB_CHARS.isdisjoint(part) for part in parts):
+        return parts, pure.root, True
+    return tuple(re.compile(fnmatch.translate(part)) for part in parts), pure.root, False
+
+
+class _TrieNode:
+    """One pattern component; children continue toward the start of the pattern."""
+
+    __slots__ = ("anchored_rules", "literal", "rule", "wild")
+
+    def __init__(self):
+        self.literal: dict[str, _TrieNode] = {}
+        self.wild: dict[str, tuple[re.Pattern[str], _TrieNode]] = {}
+        # Highest index of a rule ending here (-1 for none); anchored rules also
+        # require the path to be absolute with no components left over
+        self.rule = -1
+        self.anchored_rules: dict[str, int] = {}
+
+
+class CompiledOwners:
+    """CODEOWNERS rules precompiled to a trie, matching exactly like owner_for."""
+
+    def __init__(self, rules: list[tuple[str, list[str]]]):
+        self._rules = rules
+        # Path.match compares trailing components, so patterns are inserted last
+        # component first and rules sharing a suffix (e.g. "*.py") share nodes
+        self._root = _TrieNode()
+        for idx, (pattern, _) in enumerate(rules):
+            pure = PurePosixPath(pattern.replace("**", "*"))
+            if not pure.parts:
+                continue  # Empty patterns (e.g. ".") never match, as in owner_for
+            parts = pure.parts[1:] if pure.root else pure.parts
+            node = self._root
+            for part in reversed(parts):
+                if GLOB_CHARS.isdisjoint(part):
+                    node = node.literal.setdefault(part, _TrieNode())
+                else:
+                    if part not in node.wild:
+                        node.wild[part] = (re.compile(fnmatch.translate(part)), _TrieNode())
+                    node = node.wild[part][1]
+            # Later rules have higher indexes, so CODEOWNERS "last match wins" is a max
+            if pure.root:
+                node.anchored_rules[pure.root] = idx
+            else:
+                node.rule = idx
+
+    def owner_for(self, path: str) -> tuple[str, list[str]] | None:
+        """
+        Find the best matching owner rule for a given path.
+
+        Args:
+            path: File path to check
+
+        Returns:
+            Tuple of (pattern, owners) for the best match, or None if no match
+        """
+        pure = PurePosixPath(path)
+        parts = pure.parts
+        best = -1
+        # Walk from the last path component; each entry is (node, components left)
+        stack = [(self._root, len(parts))]
+        while stack:
+            node, left = stack.pop()
+            best = max(best, node.rule)
+            # An absolute path's first component is its root
+            if left == 1 and pure.root:
+                best = max(best, node.anchored_rules.get(pure.root, -1))
+            if not left:
+                continue
+            part = parts[left - 1]
+            child = node.literal.get(part)
+            if child is not None:
+                stack.append((child, left - 1))
+            for regex, wild_child in node.wild.values():
+                if regex.match(part):
+                    stack.append((wild_child, left - 1))
+        if best < 0:
+            return None
+        pattern, handles = self._rules[best]
+        return (pattern, handles)
+
+
+@functools.lru_cache(maxsize=8)
+def compile_codeowners(text: str) -> CompiledOwners:
+    """
+    Parse and compile CODEOWNERS content, cached per distinct file content.
+
+    Args:
+        text: Content of CODEOWNERS file
+
+    Returns:
+        Compiled rules for repeated path lookups
+    """
+    return CompiledOwners(parse_codeowners(text))
+
+
+@functools.lru_cache(maxsize=OWNER_HANDLE_CACHE_SIZE)
 def normalize_owner_handle(handle: str) -> str:
     """
     Normalize owner handle for consistent storage.
 
+    Cached, since the same few handles come back for every owned file.
+
     Args:
         handle: Raw owner handle from CODEOWNERS
 
@@ -73,6 +216,7 @@ def normalize_owner_handle(handle: str) -> str:
     return handle
 
 
+@functools.lru_cache(maxsize=OWNER_HANDLE_CACHE_SIZE)
 def get_owner_type(handle: str) -> str:
     """
     Determine if owner is a team or individual user.
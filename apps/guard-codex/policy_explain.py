@@ -4,14 +4,177 @@ Policy transparency module for GitGuard Codex.
 Provides detailed policy explanations and rule sources for PR pages.
 """
 
-import json
+import functools
+import mmap
+import os
+import re
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
 
+import orjson
+
+# Lines of context shown on each side of a policy's rule head
+SNIPPET_CONTEXT = 15
+# Top-level rule heads, e.g. "allow if {", "default allow := false", "deny contains msg if"
+RULE_HEAD = re.compile(r"^(?:default\s+)?([A-Za-z_]\w*)\s*(?:\{|:?=|\[|if\b|contains\b)")
+# Policy trees with more files than this are indexed on the scan pool, reading files in parallel
+PARALLEL_SCAN_MIN_FILES = 16
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Threads start on first use, so small policy trees never create them
+_scan_pool = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="codex-rego-scan")
+
+
+def _pretty_json(value: object) -> str:
+    """Indented JSON for a markdown code block; non-ASCII text is kept, not \\u-escaped."""
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+
+
+def _iter_rego(root: str) -> Iterator[os.DirEntry]:
+    """Every .rego file under root, walked with scandir and without following symlinks."""
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(".rego"):
+                        yield entry
+        except OSError:
+            # Missing or unreadable directories contribute no policies
+            continue
+
+
+def _rego_fingerprint(policies_dir: Path) -> tuple[tuple[str, int, int], ...]:
+    """Path, mtime and size of every .rego file; changes whenever a policy file does."""
+    fingerprint = []
+    for entry in _iter_rego(os.fspath(policies_dir)):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        fingerprint.append((entry.path, stat.st_mtime_ns, stat.st_size))
+    # Sorted, so the file that wins a fallback search does not depend on directory order
+    return tuple(sorted(fingerprint))
+
+
+def _read_window(f: Path, i: int) -> list[str]:
+    """Read the context around line i without loading the rest of the file."""
+    with f.open(encoding="utf-8", errors="ignore") as fh:
+        lines = islice(fh, max(0, i - SNIPPET_CONTEXT), i + SNIPPET_CONTEXT)
+        return [line.rstrip("\n") for line in lines]
+
+
+def _find_mention(f: Path, policy_name: str) -> list[str]:
+    """Context around the first line of f mentioning policy_name, or [] if none does."""
+    with f.open("rb") as fh:
+        if not fh.seek(0, 2):
+            return []  # mmap refuses empty files
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Most files never mention the policy; decide that on the raw bytes
+            hit = mm.find(policy_name.encode())
+            if hit < 0:
+                return []
+            # Widen the hit to whole lines in place, so a match is not read a second time
+            # and only the window is ever decoded
+            start = mm.rfind(b"\n", 0, hit) + 1
+            for _ in range(SNIPPET_CONTEXT):
+                if not start:
+                    break
+                start = mm.rfind(b"\n", 0, start - 1) + 1
+            end = hit
+            for _ in range(SNIPPET_CONTEXT):
+                end = mm.find(b"\n", end) + 1
+                if not end:
+                    end = len(mm)
+                    break
+            window = mm[start:end]
+    return window.decode("utf-8", errors="ignore").splitlines()
+
+
+def _scan_rules(f: Path) -> list[tuple[str, int]] | None:
+    """Rule heads of one file as (name, line number), or None if it can't be read."""
+    try:
+        # Streamed line by line; only rule names and positions are kept
+        with f.open(encoding="utf-8", errors="ignore") as fh:
+            return [
+                (match.group(1), i) for i, line in enumerate(fh) if (match := RULE_HEAD.match(line))
+            ]
+    except Exception:
+        return None
+
+
+class _RegoIndex:
+    """First definition of each rule across the .rego files, as (file, line number)."""
+
+    def __init__(self, fingerprint: tuple[tuple[str, int, int], ...]):
+        self.files: list[Path] = []
+        self.rules: dict[str, tuple[Path, int]] = {}
+        # Mention fallback per policy name, [] when no file mentions it
+        self._mentions: dict[str, list[str]] = {}
+        paths = [Path(path) for path, _, _ in fingerprint]
+        # map() keeps file order either way, so the first definition still wins
+        if len(paths) > PARALLEL_SCAN_MIN_FILES:
+            scanned = _scan_pool.map(_scan_rules, paths)
+        else:
+            scanned = map(_scan_rules, paths)
+        for f, heads in zip(paths, scanned, strict=True):
+            if heads is None:
+                # Skip files that can't be read
+                continue
+            self.files.append(f)
+            for name, i in heads:
+                self.rules.setdefault(name, (f, i))
+
+    def _mention(self, policy_name: str) -> list[str]:
+        """Context around the first mention of policy_name; the files are scanned once per name."""
+        if policy_name not in self._mentions:
+            snippet = []
+            for f in self.files:
+                if snippet := _find_mention(f, policy_name):
+                    break
+            self._mentions[policy_name] = snippet
+        return self._mentions[policy_name]
+
+    def snippet(self, policy_name: str) -> str:
+        """Format the context around a policy, preferring its rule head to any mention."""
+        snippet = []
+        try:
+            found = self.rules.get(policy_name)
+            if found is not None:
+                snippet = _read_window(*found)
+            if not snippet:
+                snippet = self._mention(policy_name)
+        except OSError:
+            # A policy file changed under us; the next fingerprint rebuilds the index
+            pass
+        if not snippet:
+            return "_rule source not found_"
+        return "```rego\n" + "\n".join(snippet) + "\n```"
+
+
+@functools.lru_cache(maxsize=8)
+def _index_for(fingerprint: tuple[tuple[str, int, int], ...]) -> _RegoIndex:
+    return _RegoIndex(fingerprint)
+
+
+def _build_rego_index(policies_dir: Path) -> _RegoIndex:
+    """Index the .rego files under policies_dir, reused until one of them changes."""
+    return _index_for(_rego_fingerprint(policies_dir))
+
 
 def load_rego_snippet(policy_name: str, policies_dir: Path) -> str:
     """
     Load a snippet of Rego code containing the specified policy.
 
+    The snippet is centred on the policy's first rule head, falling back to the
+    first line mentioning it. Files are indexed once and reused until a .rego
+    file under policies_dir is added, removed or modified; snippets then read
+    only the lines they show.
+
     Args:
         policy_name: Name of the policy to find
         policies_dir: Directory containing .rego policy files
@@ -19,31 +182,7 @@ def load_rego_snippet(policy_name: str, policies_dir: Path) -> str:
     Returns:
         Formatted code block with ~30 lines of context around the policy
     """
-    snippet = []
-
-    # Search through all .rego files in the policies directory
-    for f in policies_dir.glob("**/*.rego"):
-        try:
-            text = f.read_text(encoding="utf-8", errors="ignore")
-            if policy_name in text:
-                # Find the first occurrence and grab context around it
-                lines = text.splitlines()
-                for i, line in enumerate(lines):
-                    if policy_name in line:
-                        # Get 15 lines before and after for context
-                        lo, hi = max(0, i - 15), min(len(lines), i + 15)
-                        snippet = lines[lo:hi]
-                        break
-                if snippet:
-                    break
-        except Exception:
-            # Skip files that can't be read
-            continue
-
-    if snippet:
-        return "```rego\n" + "\n".join(snippet) + "\n```"
-    else:
-        return "_rule source not found_"
+    return _build_rego_index(policies_dir).snippet(policy_name)
 
 
 def render_policy_block(policies: list[str], opa_inputs: dict, policies_dir: str) -> str:
@@ -69,16 +208,16 @@ def render_policy_block(policies: list[str], opa_inputs: dict, policies_dir: str
     # Add collapsible section for OPA inputs
     parts.append(
         "\n<details><summary>OPA inputs used</summary>\n\n```json\n"
-        + json.dumps(opa_inputs or {}, indent=2)
+        + _pretty_json(opa_inputs or {})
         + "\n```\n</details>\n"
     )
 
-    # Add collapsible sections for each policy's source code
-    policies_path = Path(policies_dir)
+    # Add collapsible sections for each policy's source code; one index serves them all
+    index = _build_rego_index(Path(policies_dir))
     for policy in policies:
         parts.append(
             f"\n<details><summary>Source: <code>{policy}</code></summary>\n\n"
-            + load_rego_snippet(policy, policies_path)
+            + index.snippet(policy)
             + "\n</details>\n"
         )
 
@@ -112,6 +251,6 @@ def explain_policy_decision(
 
     # Add relevant inputs
     if inputs:
-        explanation += f"<details><summary>Evaluation Inputs</summary>\n\n```json\n{json.dumps(inputs, indent=2)}\n```\n</details>\n\n"
+        explanation += f"<details><summary>Evaluation Inputs</summary>\n\n```json\n{_pretty_json(inputs)}\n```\n</details>\n\n"
 
     return explanation
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Mermaid graphs for GitGuard Codex PR pages.
+Pure string formatting with no third-party imports, so it can be used without the worker stack.
+"""
+
+# Constants for magic numbers
+MAX_CHANGED_FILES_DISPLAY = 20
+MAX_POLICIES_DISPLAY = 10
+MAX_FILENAME_LENGTH = 30
+MAX_POLICY_NAME_LENGTH = 20
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Keep the last `limit` characters, prefixed with an ellipsis when cut."""
+    return "..." + text[-limit:] if len(text) > limit else text
+
+
+def _mermaid(pr_num: int, changed: list[str], policies: list[str]) -> str:
+    """Generate Mermaid graph showing PR touches and governance relationships."""
+    lines = [
+        "```mermaid",
+        "graph LR",
+        f'  PR["PR #{pr_num}"]',
+        # cap to keep it readable
+        *(
+            f'  PR -->|touches| F{idx}["{_truncate(path, MAX_FILENAME_LENGTH)}"]'
+            for idx, path in enumerate(changed[:MAX_CHANGED_FILES_DISPLAY])
+        ),
+        *(
+            f'  PR -->|governed_by| P{idx}["{_truncate(policy, MAX_POLICY_NAME_LENGTH)}"]'
+            for idx, policy in enumerate((policies or [])[:MAX_POLICIES_DISPLAY])
+        ),
+        "```",
+    ]
+    return "\n".join(lines)
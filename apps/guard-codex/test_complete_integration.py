@@ -1,16 +1,7 @@
 #!/usr/bin/env python3
 """Complete integration test showing policy transparency + Mermaid graphs."""
 
-
-def _mermaid(pr_num: int, changed: list[str], policies: list[str]) -> str:
-    """Generate Mermaid graph showing PR touches and governance relationships."""
-    lines = ["```mermaid", "graph LR", f'  PR["PR #{pr_num}"]']
-    for i, f in enumerate(changed[:20]):  # cap to keep it readable
-        lines.append(f"  PR -->|touches| F{i}[\"{'...' + f[-30:] if len(f) > 30 else f}\"]")
-    for j, p in enumerate((policies or [])[:10]):
-        lines.append(f"  PR -->|governed_by| P{j}[\"{'...' + p[-20:] if len(p) > 20 else p}\"]")
-    lines.append("```")
-    return "\n".join(lines)
+from pr_graph import _mermaid
 
 
 def simulate_pr_page_generation():
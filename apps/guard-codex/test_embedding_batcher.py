@@ -0,0 +1,37 @@
+import asyncio
+
+import activities
+import pytest
+from activities import _EmbeddingBatcher
+
+
+@pytest.fixture
+def generated(monkeypatch):
+    """Record each _generate_embeddings batch instead of embedding it"""
+    batches = []
+    monkeypatch.setattr(activities, "_generate_embeddings", batches.append)
+    return batches
+
+
+class TestEmbeddingBatcher:
+    """Test render_docs embeddings are stored in shared batches"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_renders_share_one_batch(self, generated):
+        """Test facts queued while a batch lingers are embedded in one call"""
+        batcher = _EmbeddingBatcher()
+        facts = [{"kind": "PR", "number": n} for n in range(3)]
+
+        await asyncio.gather(*(batcher.add(f) for f in facts))
+
+        assert generated == [facts]
+
+    @pytest.mark.asyncio
+    async def test_later_render_starts_a_new_batch(self, generated):
+        """Test facts queued after a batch was taken go into the next one"""
+        batcher = _EmbeddingBatcher()
+
+        await batcher.add({"kind": "PR", "number": 1})
+        await batcher.add({"kind": "PR", "number": 2})
+
+        assert generated == [[{"kind": "PR", "number": 1}], [{"kind": "PR", "number": 2}]]
@@ -1,6 +1,7 @@
 import subprocess
 from unittest.mock import patch
 
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
 from main import PREvent, app
@@ -229,15 +230,11 @@ class TestPRDigestEndpoint:
 class TestSemanticSearch:
     """Test semantic search functionality"""
 
-    @patch("main.embed")
     @patch("main.search_similar")
-    def test_semantic_search_success(self, mock_search, mock_embed):
+    def test_semantic_search_success(self, mock_search):
         """Test successful semantic search"""
         client = TestClient(app)
 
-        # Mock embedding generation
-        mock_embed.return_value = [0.1] * 1536  # Mock 1536-dim vector
-
         # Mock search results
         mock_results = [
             {"id": "pr_123", "content": "Bug fix for authentication", "score": 0.95},
@@ -255,31 +252,47 @@ class TestSemanticSearch:
         assert len(data["results"]) == 2
         assert data["results"][0]["id"] == "pr_123"
 
-        mock_embed.assert_called_once_with("authentication bug")
-        mock_search.assert_called_once_with([0.1] * 1536, limit=20)
+        # search_similar embeds the query text itself
+        mock_search.assert_called_once_with("authentication bug", limit=20)
+
+    @patch("embeddings._conn")
+    @patch("embeddings.embed", return_value=np.full(1536, 0.1, np.float32))
+    def test_semantic_search_queries_the_database(self, mock_embed, mock_conn):
+        """Test the endpoint runs the real search_similar against the database"""
+        client = TestClient(app)
+
+        cur = mock_conn.return_value.__enter__.return_value.cursor.return_value.__enter__
+        cur.return_value.fetchall.return_value = [("PR", "pr:7", "Fix login", {"number": 7}, 0.25)]
 
-    @patch("main.embed")
+        response = client.get("/search?q=login bug")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "ok"
+        assert data["count"] == 1
+        assert data["results"][0]["key"] == "pr:7"
+        assert data["results"][0]["score"] == 0.75
+
+        mock_embed.assert_called_once_with("login bug")
+
+    @patch("embeddings.embed", return_value=np.zeros(0, np.float32))
     def test_semantic_search_embedding_failure(self, mock_embed):
         """Test semantic search when embedding generation fails"""
         client = TestClient(app)
 
-        # Mock embedding failure
-        mock_embed.return_value = []
-
         response = client.get("/search?q=test query")
 
         assert response.status_code == 200
         data = response.json()
-        assert data["status"] == "error"
-        assert "Embedding generation unavailable" in data["message"]
+        assert data["status"] == "ok"
+        assert data["results"] == []
+        assert data["count"] == 0
 
-    @patch("main.embed")
     @patch("main.search_similar")
-    def test_semantic_search_exception_handling(self, mock_search, mock_embed):
+    def test_semantic_search_exception_handling(self, mock_search):
         """Test semantic search exception handling"""
         client = TestClient(app)
 
-        mock_embed.return_value = [0.1] * 1536
         mock_search.side_effect = Exception("Database connection failed")
 
         response = client.get("/search?q=test query")
@@ -0,0 +1,96 @@
+import itertools
+
+import pytest
+from ownership import (
+    compile_codeowners,
+    get_owner_type,
+    normalize_owner_handle,
+    owner_for,
+    parse_codeowners,
+)
+
+CODEOWNERS = """
+# Global owners
+*                       @org/core
+*.py                    @org/python
+docs/*                  @org/docs
+/docs/*                 @org/docs-root
+apps/**/*.py            @org/apps
+apps/guard-?odex/*      @org/codex
+[st]rc/*.[ch]           @org/native
+tests/[!p]*             @org/qa
+"""
+
+PATHS = [
+    "README.md",
+    "main.py",
+    "docs/index.md",
+    "site/docs/index.md",
+    "/docs/index.md",
+    "apps/guard-codex/activities.py",
+    "apps/guard-codex/Dockerfile",
+    "apps/guard-api/main.py",
+    "src/lib.c",
+    "rc/lib.h",
+    "tests/test_x.py",
+    "tests/performance/x.txt",
+    "a/b/c/d/e/f.txt",
+]
+
+
+class TestCompiledOwners:
+    """Test compiled CODEOWNERS lookups against the per-rule matcher"""
+
+    @pytest.mark.parametrize("path", PATHS)
+    def test_matches_owner_for(self, path):
+        """Test the compiled rules pick the same rule as owner_for"""
+        rules = parse_codeowners(CODEOWNERS)
+        assert compile_codeowners(CODEOWNERS).owner_for(path) == owner_for(path, rules)
+
+    def test_every_rule_subset_matches_owner_for(self):
+        """Test last-match-wins ordering holds for each pair of rules"""
+        rules = parse_codeowners(CODEOWNERS)
+        for pair in itertools.permutations(rules, 2):
+            text = "\n".join(f"{pattern} {' '.join(handles)}" for pattern, handles in pair)
+            compiled = compile_codeowners(text)
+            for path in PATHS:
+                assert compiled.owner_for(path) == owner_for(path, list(pair))
+
+    def test_no_rules_matches_nothing(self):
+        """Test an empty CODEOWNERS owns no paths"""
+        assert compile_codeowners("").owner_for("main.py") is None
+
+    def test_compiled_rules_are_cached_per_content(self):
+        """Test identical content reuses the compiled rules"""
+        assert compile_codeowners(CODEOWNERS) is compile_codeowners(CODEOWNERS)
+
+    def test_many_rules_keep_last_match_wins(self):
+        """Test hundreds of same-depth rules still resolve to the last matching one"""
+        text = "\n".join(f"dir{i % 50}/* @org/team{i}" for i in range(500))
+        compiled = compile_codeowners(text)
+        assert compiled.owner_for("dir7/file.py") == ("dir7/*", ["@org/team457"])
+
+    def test_empty_pattern_matches_nothing(self):
+        """Test a pattern that normalizes to no components owns no paths"""
+        rules = parse_codeowners(". @org/dot")
+        assert owner_for("main.py", rules) is None
+        assert compile_codeowners(". @org/dot").owner_for("main.py") is None
+
+
+class TestOwnerHandles:
+    """Test owner handle normalization"""
+
+    @pytest.mark.parametrize(
+        ("handle", "normalized", "owner_type"),
+        [
+            ("@org/core", "org/core", "team"),
+            ("@alice", "alice", "user"),
+            ("dev@example.com", "dev@example.com", "user"),
+        ],
+    )
+    def test_normalize_and_classify(self, handle, normalized, owner_type):
+        """Test the @ prefix is dropped and teams are told apart from users"""
+        assert normalize_owner_handle(handle) == normalized
+        assert get_owner_type(handle) == owner_type
+        # Repeated handles are answered from the cache with the same result
+        assert get_owner_type(handle) == owner_type
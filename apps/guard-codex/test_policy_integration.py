@@ -6,7 +6,8 @@ This shows how the policy transparency feature works on PR pages.
 
 from pathlib import Path
 
-from policy_explain import render_policy_block
+import policy_explain
+from policy_explain import load_rego_snippet, render_policy_block
 
 
 def test_policy_explanation():
@@ -68,6 +69,61 @@ def test_empty_policies():
     return empty_result
 
 
+def test_rego_snippet_follows_policy_edits(tmp_path):
+    """Cached snippets are refreshed when a policy file changes."""
+    rego = tmp_path / "guard.rego"
+    rego.write_text("package guard\n\nallow if { true }\n")
+    assert "allow if { true }" in load_rego_snippet("allow", tmp_path)
+
+    rego.write_text("package guard\n\nallow if { input.checks_passed }\n")
+    assert "input.checks_passed" in load_rego_snippet("allow", tmp_path)
+
+    rego.unlink()
+    assert load_rego_snippet("allow", tmp_path) == "_rule source not found_"
+
+
+def test_rego_snippet_prefers_rule_head(tmp_path):
+    """A rule's definition wins over earlier lines that only mention it."""
+    lines = ["package guard", "", "# allow merges when checks pass"]
+    lines += [f"# filler {i}" for i in range(40)]
+    lines += ["allow if {", "    input.pr.checks_passed", "}"]
+    (tmp_path / "guard.rego").write_text("\n".join(lines) + "\n")
+
+    snippet = load_rego_snippet("allow", tmp_path)
+    assert "input.pr.checks_passed" in snippet
+    assert "package guard" not in snippet
+    assert "filler 0" in load_rego_snippet("merges when", tmp_path)
+
+
+def test_large_policy_tree_keeps_first_definition(tmp_path):
+    """Trees indexed in parallel still resolve a rule to its first file in path order."""
+    for i in range(40):
+        sub = tmp_path / f"team{i:02d}"
+        sub.mkdir()
+        (sub / "rules.rego").write_text(f"package team{i}\n\nshared if {{ {i} }}\n")
+
+    snippet = load_rego_snippet("shared", tmp_path)
+    assert "package team0\n" in snippet
+    assert "shared if { 0 }" in snippet
+
+
+def test_rego_mentions_scanned_once_per_name(tmp_path, monkeypatch):
+    """Repeated lookups of a mention-only name reuse the first scan of the files."""
+    for name in ("a.rego", "b.rego"):
+        (tmp_path / name).write_text("package guard\n\n# see deny_force_push\n")
+    scans = []
+    find_mention = policy_explain._find_mention
+    monkeypatch.setattr(
+        policy_explain, "_find_mention", lambda f, name: scans.append(f) or find_mention(f, name)
+    )
+
+    for _ in range(3):
+        assert "deny_force_push" in load_rego_snippet("deny_force_push", tmp_path)
+        assert load_rego_snippet("unknown_rule", tmp_path) == "_rule source not found_"
+    # a.rego holds the first hit; the miss scans both files, once
+    assert [f.name for f in scans] == ["a.rego", "a.rego", "b.rego"]
+
+
 if __name__ == "__main__":
     # Test with sample data
     test_policy_explanation()
@@ -1,8 +1,19 @@
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
 import structlog
 
+# Listener that owns the stdout handler; replaced on every configure_logging() call
+_queue_listeners: list[QueueListener] = []
+
+
+def _stop_queue_listeners() -> None:
+    while _queue_listeners:
+        _queue_listeners.pop().stop()
+
 
 def configure_logging(level: str = "INFO") -> None:
     timestamper = structlog.processors.TimeStamper(fmt="iso")
@@ -19,12 +30,23 @@ def configure_logging(level: str = "INFO") -> None:
         logger_factory=structlog.stdlib.LoggerFactory(),
         cache_logger_on_first_use=True,
     )
+    # Request handlers only enqueue records; a listener thread does the stdout writes
+    _stop_queue_listeners()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_listener = QueueListener(log_queue, stream_handler)
     logging.basicConfig(
         format="%(message)s",
-        stream=sys.stdout,
+        handlers=[QueueHandler(log_queue)],
         level=getattr(logging, level, logging.INFO),
         force=True,
     )
+    queue_listener.start()
+    _queue_listeners.append(queue_listener)
+
+
+atexit.register(_stop_queue_listeners)
 
 
 logger = structlog.get_logger()
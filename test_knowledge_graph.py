@@ -1,4 +1,3 @@
-import json
 import os
 import sys
 import unittest
@@ -23,22 +22,23 @@ except ImportError as e:
     # Mock the modules to avoid complex dependency issues
     # We'll test the interface and behavior patterns rather than actual implementation
     class MockActivities:
-        @staticmethod
-        def _upsert_node(conn, ntype: str, nkey: str, title: str = None, data: dict = None):
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO codex_nodes (ntype, nkey, title, data) VALUES (%s, %s, %s, %s) ON CONFLICT (ntype, nkey) DO UPDATE SET title = EXCLUDED.title, data = EXCLUDED.data RETURNING id",
-                    (ntype, nkey, title, json.dumps(data) if data else None),
-                )
-                return cur.fetchone()[0]
-
-        @staticmethod
-        def _link(conn, src_id: int, dst_id: int, rel: str, data: dict = None):
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO codex_edges (src, dst, rel, data) VALUES (%s, %s, %s, %s) ON CONFLICT (src, dst, rel) DO UPDATE SET data = EXCLUDED.data",
-                    (src_id, dst_id, rel, json.dumps(data) if data else None),
-                )
+        class _GraphBatch:
+            def __init__(self):
+                self.nodes = []
+                self.edges = {}
+                self._handles = {}
+
+            def node(self, ntype: str, nkey: str, title: str, data: dict) -> int:
+                handle = self._handles.get((ntype, nkey))
+                if handle is None:
+                    self._handles[(ntype, nkey)] = len(self.nodes)
+                    self.nodes.append((ntype, nkey, title, data))
+                    return len(self.nodes) - 1
+                self.nodes[handle] = (ntype, nkey, title, {**self.nodes[handle][3], **data})
+                return handle
+
+            def link(self, src: int, dst: int, rel: str, data: dict = None):
+                self.edges.setdefault((src, dst, rel), data)
 
         @staticmethod
         def _ensure_schema(conn):
@@ -51,20 +51,13 @@ except ImportError as e:
                 )
 
         @staticmethod
-        def _check_delivery_seen(conn, delivery_id: str) -> bool:
+        def _claim_delivery(conn, delivery_id: str) -> bool:
             with conn.cursor() as cur:
                 cur.execute(
-                    "SELECT 1 FROM codex_seen_deliveries WHERE delivery_id = %s", (delivery_id,)
-                )
-                return cur.fetchone() is not None
-
-        @staticmethod
-        def _mark_delivery_seen(conn, delivery_id: str):
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO codex_seen_deliveries (delivery_id) VALUES (%s) ON CONFLICT DO NOTHING",
+                    "INSERT INTO codex_seen_deliveries (delivery_id) VALUES (%s) ON CONFLICT DO NOTHING RETURNING delivery_id",
                     (delivery_id,),
                 )
+                return cur.fetchone() is not None
 
         @staticmethod
         def update_graph(pr_data: dict, analysis: dict = None):
@@ -78,14 +71,6 @@ except ImportError as e:
                 )
             return True
 
-        @staticmethod
-        def _insert_embedding(conn, node_id: int, embedding: list):
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO codex_embeddings (node_id, embedding) VALUES (%s, %s) ON CONFLICT (node_id) DO UPDATE SET embedding = EXCLUDED.embedding",
-                    (node_id, embedding),
-                )
-
         @staticmethod
         def _cleanup_old_deliveries(conn, days_old=30):
             with conn.cursor() as cur:
@@ -187,14 +172,11 @@ class MockConnection:
 
 
 # Assign functions from mock instances for easy access in tests
-_upsert_node = activities._upsert_node
-_link = activities._link
+_GraphBatch = activities._GraphBatch
 _ensure_schema = activities._ensure_schema
-_check_delivery_seen = activities._check_delivery_seen
-_mark_delivery_seen = activities._mark_delivery_seen
+_claim_delivery = activities._claim_delivery
 update_graph = activities.update_graph
 _validate_vector_dimension = activities._validate_vector_dimension
-_insert_embedding = activities._insert_embedding
 _cleanup_old_deliveries = activities._cleanup_old_deliveries
 _cleanup_temporary_branch_edges = activities._cleanup_temporary_branch_edges
 cleanup_database = activities.cleanup_database
@@ -205,61 +187,56 @@ record_graph_update = metrics.record_graph_update
 class TestKnowledgeGraphOperations(unittest.TestCase):
     """Test knowledge graph node and relationship operations."""
 
-    def setUp(self):
-        self.mock_conn = MockConnection()
-        self.test_node_id = str(uuid.uuid4())
-
-    def test_upsert_node_creation(self):
-        """Test creating a new node in the knowledge graph."""
-        # Test data
-        ntype = "PR"
-        nkey = "pr:123"
-        title = "Test PR #123"
-        data = {"number": 123, "author": "testuser"}
+    def test_graph_batch_node_creation(self):
+        """Test queuing distinct nodes hands out one handle per node."""
+        batch = _GraphBatch()
 
-        # Execute
-        result_id = _upsert_node(self.mock_conn, ntype, nkey, title, data)
+        pr = batch.node("PR", "pr:123", "Test PR #123", {"number": 123, "author": "testuser"})
+        f = batch.node("File", "file:src/main.py", "src/main.py", {"path": "src/main.py"})
 
-        # Verify - mock implementation returns 1
-        self.assertEqual(result_id, 1)
+        self.assertEqual((pr, f), (0, 1))
+        self.assertEqual(len(batch.nodes), 2)
 
-    def test_upsert_node_update(self):
-        """Test updating an existing node in the knowledge graph."""
-        # Test updating existing node
-        ntype = "PR"
-        nkey = "pr:123"
-        title = "Updated PR #123"
-        data = {"number": 123, "author": "testuser", "status": "merged"}
+    def test_graph_batch_node_update(self):
+        """Test a repeated node keeps its handle, takes the last title and merges data."""
+        batch = _GraphBatch()
 
-        result_id = _upsert_node(self.mock_conn, ntype, nkey, title, data)
+        first = batch.node("PR", "pr:123", "Test PR #123", {"number": 123, "author": "testuser"})
+        again = batch.node("PR", "pr:123", "Updated PR #123", {"status": "merged"})
 
-        # Verify - mock implementation returns 1
-        self.assertEqual(result_id, 1)
+        self.assertEqual(first, again)
+        self.assertEqual(
+            batch.nodes,
+            [
+                (
+                    "PR",
+                    "pr:123",
+                    "Updated PR #123",
+                    {"number": 123, "author": "testuser", "status": "merged"},
+                )
+            ],
+        )
 
-    def test_link_creation(self):
-        """Test creating relationships between nodes."""
-        # Test data
-        src_id = str(uuid.uuid4())
-        dst_id = str(uuid.uuid4())
-        rel = "touches"
-        data = {"confidence": 0.95}
+    def test_graph_batch_link_creation(self):
+        """Test a repeated relationship keeps the data it was first queued with."""
+        batch = _GraphBatch()
+        pr = batch.node("PR", "pr:123", "Test PR #123", {})
+        f = batch.node("File", "file:src/main.py", "src/main.py", {})
 
-        # Execute
-        _link(self.mock_conn, src_id, dst_id, rel, data)
+        batch.link(pr, f, "touches", {"confidence": 0.95})
+        batch.link(pr, f, "touches", {"confidence": 0.5})
 
-        # Verify - mock implementation doesn't raise errors
-        self.assertTrue(True)
+        self.assertEqual(batch.edges, {(pr, f, "touches"): {"confidence": 0.95}})
 
-    def test_link_without_data(self):
+    def test_graph_batch_link_without_data(self):
         """Test creating relationships without additional data."""
-        src_id = str(uuid.uuid4())
-        dst_id = str(uuid.uuid4())
-        rel = "governed_by"
+        batch = _GraphBatch()
+        pr = batch.node("PR", "pr:123", "Test PR #123", {})
+        policy = batch.node("Policy", "policy:allow", "allow", {})
 
-        _link(self.mock_conn, src_id, dst_id, rel)
+        batch.link(pr, policy, "governed_by")
 
-        # Verify - mock implementation doesn't raise errors
-        self.assertTrue(True)
+        self.assertEqual(batch.edges, {(pr, policy, "governed_by"): None})
 
 
 class TestGraphSchemaOperations(unittest.TestCase):
@@ -276,29 +253,20 @@ class TestGraphSchemaOperations(unittest.TestCase):
         # Verify - mock implementation doesn't raise errors
         self.assertTrue(True)
 
-    def test_check_delivery_seen_exists(self):
-        """Test checking if delivery has been processed."""
+    def test_claim_delivery_new(self):
+        """Test claiming a delivery that has not been processed."""
         delivery_id = "test-delivery-123"
-        result = _check_delivery_seen(self.mock_conn, delivery_id)
+        self.mock_conn.cursor_mock.set_fetchone_results([(delivery_id,)])
 
-        # Mock implementation returns True for existing deliveries
-        self.assertTrue(result)
-
-    def test_check_delivery_seen_not_exists(self):
-        """Test checking non-existent delivery."""
-        delivery_id = "non-existent-delivery"
-        result = _check_delivery_seen(self.mock_conn, delivery_id)
+        # The insert returned the row, so this run owns the delivery
+        self.assertTrue(_claim_delivery(self.mock_conn, delivery_id))
 
-        # Mock implementation returns True for any delivery
-        self.assertTrue(result)
-
-    def test_mark_delivery_seen(self):
-        """Test marking delivery as processed."""
+    def test_claim_delivery_already_seen(self):
+        """Test claiming a delivery that was already processed."""
         delivery_id = "test-delivery-456"
-        _mark_delivery_seen(self.mock_conn, delivery_id)
 
-        # Verify - mock implementation doesn't raise errors
-        self.assertTrue(True)
+        # ON CONFLICT DO NOTHING returns no row for a known delivery
+        self.assertFalse(_claim_delivery(self.mock_conn, delivery_id))
 
 
 class TestUpdateGraphActivity(unittest.TestCase):
@@ -472,26 +440,6 @@ class TestEmbeddingOperations(unittest.TestCase):
         result = _validate_vector_dimension(vector, expected_dim=768)
         self.assertTrue(result)
 
-    def test_insert_embedding_success(self):
-        """Test successful embedding insertion."""
-        node_id = str(uuid.uuid4())
-        vector = [0.1] * 1536
-
-        _insert_embedding(self.mock_conn, node_id, vector)
-
-        # Verify - mock implementation doesn't raise errors
-        self.assertTrue(True)
-
-    def test_insert_embedding_invalid_dimension(self):
-        """Test embedding insertion with invalid dimension."""
-        node_id = str(uuid.uuid4())
-        vector = [0.1] * 512  # Wrong dimension
-
-        with self.assertRaises(ValueError) as context:
-            _insert_embedding(self.mock_conn, node_id, vector)
-
-        self.assertIn("Vector dimension", str(context.exception))
-
 
 class TestCleanupOperations(unittest.TestCase):
     """Test database cleanup operations."""
@@ -47,10 +47,10 @@ def test_mermaid_graphs():
     """Test that Mermaid graphs appear on PR pages (≤20 nodes)."""
     print("\n🔍 Testing Mermaid Graph Integration...")
 
-    activities_file = "apps/guard-codex/activities.py"
+    graph_file = "apps/guard-codex/pr_graph.py"
 
     try:
-        with open(activities_file, encoding="utf-8") as f:
+        with open(graph_file, encoding="utf-8") as f:
             content = f.read()
 
         checks = [
@@ -73,10 +73,10 @@ def test_mermaid_graphs():
         return all_passed
 
     except FileNotFoundError:
-        print(f"❌ Activities file not found: {activities_file}")
+        print(f"❌ Graph module not found: {graph_file}")
         return False
     except Exception as e:
-        print(f"❌ Error reading activities file: {e}")
+        print(f"❌ Error reading graph module: {e}")
         return False
 
 
@@ -17,16 +17,16 @@ def test_api_file_exists():
 
         # Check for required components
         checks = [
-            ("from fastapi import FastAPI", "FastAPI import"),
+            ("from fastapi import Depends, FastAPI", "FastAPI import"),
             ("from fastapi.middleware.cors import CORSMiddleware", "CORS middleware import"),
-            ("import psycopg", "PostgreSQL driver import"),
+            ("from psycopg_pool import AsyncConnectionPool", "PostgreSQL pool import"),
             ("app = FastAPI()", "FastAPI app creation"),
             ("app.add_middleware", "CORS middleware setup"),
             ('allow_origins=["*"]', "CORS origins configuration"),
             ('allow_methods=["GET"]', "CORS methods configuration"),
-            ('@app.get("/graph/pr/{number}")', "PR graph endpoint"),
-            ("def pr_graph(number: int)", "PR graph function"),
-            ("psycopg.connect", "Database connection"),
+            ('@app.get("/graph/pr/{number}"', "PR graph endpoint"),
+            ("async def pr_graph(number: int", "PR graph function"),
+            ("pool.connection()", "Pooled database connection"),
             ("codex_nodes", "Nodes table query"),
             ("codex_edges", "Edges table query"),
             ('return {"nodes": nodes, "edges": edges}', "Graph data return"),